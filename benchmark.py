@@ -0,0 +1,487 @@
+"""Banco de pruebas del motor de búsqueda, sin dependencias de Qt.
+
+Genera colecciones sintéticas reproducibles con casi duplicados conocidos
+y mide cada fase de la búsqueda::
+
+    python -m benchmark generate CARPETA [--originals N] [--seed S]
+    python -m benchmark run CARPETA [-o resultados.json] [--compare anterior.json]
+    python -m benchmark startup [--budget MS]
+
+El resultado es un JSON con los tiempos por fase, el rendimiento, la
+memoria máxima y la precisión y exhaustividad de la agrupación en cada
+umbral, para comparar ejecuciones entre commits. ``startup`` mide lo que
+tarda en importarse la interfaz y falla si pasa del presupuesto o si carga
+alguno de los módulos que deben importarse al usarse.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import itertools
+import subprocess
+import multiprocessing
+import concurrent.futures
+from PIL import Image, ImageDraw, ImageFilter
+from escaner import (
+    Scanner, ScanState, HASH_ALGORITHMS, VERIFY_METHODS, DIHEDRAL_MODES, hash_image,
+    hamming, primary_hash
+)
+
+try:
+    import resource
+except ImportError:
+    # Windows: sin memoria máxima
+    resource = None
+
+# Archivo con la verdad de la colección: ruta relativa -> id del original
+TRUTH_FILE = "corpus.json"
+VARIANTS = ("resize", "recompress", "crop", "rotate")
+
+# Umbral cuyo radio no deben pasar los hashes de la decodificación reducida
+# respecto a los de la completa
+DRAFT_TOLERANCE = 1
+
+# Presupuesto de importación de la interfaz, antes de crear la ventana
+STARTUP_BUDGET_MS = 500
+# Módulos pesados que la interfaz solo importa cuando los necesita
+LAZY_MODULES = ("imagehash", "scipy", "pywt", "PIL", "send2trash")
+
+def synthetic_image(rng, size):
+    """Imagen con formas y colores aleatorios, distinta para cada semilla."""
+    width, height = size
+    img = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(6, 14)):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1 = x0 + rng.randint(width // 10, width // 2)
+        y1 = y0 + rng.randint(height // 10, height // 2)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.ellipse((x0, y0, x1, y1), fill=color)
+        else:
+            draw.rectangle((x0, y0, x1, y1), fill=color)
+    return img.filter(ImageFilter.GaussianBlur(2))
+
+def make_variant(img, kind, rng):
+    """Casi duplicado de ``img``: devuelve ``(imagen, extensión, opciones de save)``."""
+    if kind == "resize":
+        scale = rng.choice((0.5, 0.75, 1.5))
+        return img.resize((int(img.width * scale), int(img.height * scale)), Image.LANCZOS), ".jpg", {"quality": 90}
+    if kind == "recompress":
+        return img, ".jpg", {"quality": rng.randint(30, 60)}
+    if kind == "crop":
+        dx, dy = img.width * rng.randint(2, 6) // 100, img.height * rng.randint(2, 6) // 100
+        return img.crop((dx, dy, img.width - dx, img.height - dy)), ".jpg", {"quality": 90}
+    if kind == "rotate":
+        return img.transpose(rng.choice((Image.ROTATE_90, Image.ROTATE_180, Image.ROTATE_270))), ".jpg", {"quality": 90}
+    raise ValueError(f"Variante desconocida: {kind}")
+
+def generate_corpus(folder, originals=200, seed=0, size=(640, 480), variants=VARIANTS,
+                    subfolders=4):
+    """Genera la colección en ``folder`` y guarda su verdad en ``TRUTH_FILE``.
+
+    Cada original recibe entre cero y ``len(variants)`` casi duplicados, así
+    que también hay imágenes sin pareja. Con la misma semilla y la misma
+    versión de Pillow los archivos son idénticos.
+    """
+    rng = random.Random(seed)
+    truth = {}
+    for k in range(subfolders):
+        os.makedirs(os.path.join(folder, f"carpeta{k}"), exist_ok=True)
+    for i in range(originals):
+        sub = f"carpeta{i % subfolders}"
+        img = synthetic_image(rng, size)
+        # Uno de cada cuatro originales sin pérdida, para mezclar formatos
+        ext = ".png" if i % 4 == 0 else ".jpg"
+        name = os.path.join(sub, f"img{i:05d}{ext}")
+        img.save(os.path.join(folder, name), **({} if ext == ".png" else {"quality": 92}))
+        truth[name] = i
+        for kind in rng.sample(list(variants), rng.randint(0, len(variants))):
+            variant, ext, options = make_variant(img, kind, rng)
+            name = os.path.join(f"carpeta{rng.randrange(subfolders)}", f"img{i:05d}_{kind}{ext}")
+            variant.save(os.path.join(folder, name), **options)
+            truth[name] = i
+    with open(os.path.join(folder, TRUTH_FILE), "w", encoding="utf-8") as f:
+        json.dump({"seed": seed, "originals": originals, "size": list(size),
+                   "variants": list(variants), "files": truth}, f, indent=1)
+    return truth
+
+def peak_rss_mb():
+    """Memoria máxima del proceso y del mayor de sus procesos hijos, en MB."""
+    if resource is None:
+        return None
+    # ru_maxrss viene en KB en Linux y en bytes en macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return {"main": round(own / 2 ** 20, 1), "workers": round(children / 2 ** 20, 1)}
+
+def decode_pass(conn, paths, algorithms, dihedral, draft, workers):
+    """Decodifica y hashea ``paths`` en un pool propio y envía el resultado por ``conn``.
+
+    Corre en un proceso aparte para cada modo de decodificación: así la
+    memoria máxima de ese proceso y de sus hijos es solo la de ese modo.
+    """
+    start = time.perf_counter()
+    decode_s = hash_s = 0.0
+    hashes = {}
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        results = pool.map(hash_image, paths, itertools.repeat(algorithms),
+                           itertools.repeat(dihedral), itertools.repeat(draft), chunksize=16)
+        for result in results:
+            decode_s += result.decode_time
+            hash_s += result.hash_time
+            if result.error is not None:
+                print(f"Error con {result.path}: {result.error}", file=sys.stderr)
+            else:
+                hashes[result.path] = result.hash
+    conn.send({"seconds": time.perf_counter() - start, "decode_cpu_seconds": decode_s,
+               "hash_cpu_seconds": hash_s, "hashes": hashes, "peak_rss_mb": peak_rss_mb()})
+    conn.close()
+
+def run_decode_pass(paths, algorithms, dihedral, draft, workers):
+    # Un proceso nuevo por modo: ``ru_maxrss`` no se puede poner a cero
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=decode_pass,
+                              args=(sender, paths, algorithms, dihedral, draft, workers))
+    process.start()
+    sender.close()
+    try:
+        # Recibir antes de esperar: el resultado puede no caber en la tubería
+        result = receiver.recv()
+    except EOFError:
+        raise RuntimeError("El proceso de decodificación terminó sin resultado") from None
+    finally:
+        process.join()
+    return result
+
+def draft_stability(scanner, reference, draft, tolerance):
+    """Compara los hashes de la decodificación reducida con los de la completa.
+
+    Mide, para cada archivo hasheado en los dos modos, la distancia del hash
+    principal sin girar y, si hay verificación, la de su valor; un archivo
+    queda fuera de tolerancia si alguna pasa del radio del umbral
+    ``tolerance``.
+    """
+    radius = scanner.radius_for(tolerance)
+    verify_radius = scanner.verify_radius_for(tolerance) if scanner.verify else None
+    distances = []
+    outside = []
+    for path in sorted(set(reference) & set(draft)):
+        full_hash, draft_hash = reference[path], draft[path]
+        distance = hamming(primary_hash(full_hash), primary_hash(draft_hash))
+        verify_distance = None
+        if scanner.verify:
+            verify_distance = float(scanner.verify_distance(full_hash[scanner.probes],
+                                                            draft_hash[scanner.probes]))
+        distances.append(distance)
+        if distance > radius or (verify_distance is not None and verify_distance > verify_radius):
+            outside.append({"path": path, "distance": distance, "verify_distance": verify_distance})
+    return {
+        "tolerance_threshold": tolerance,
+        "radius": radius,
+        "verify_radius": verify_radius,
+        "files": len(distances),
+        "identical": sum(1 for d in distances if d == 0),
+        "mean_distance": round(sum(distances) / len(distances), 3) if distances else None,
+        "max_distance": max(distances, default=None),
+        "outside": outside,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def pair_scores(groups, truth):
+    """Precisión y exhaustividad por pares de ``groups`` (listas de rutas relativas)."""
+    def pairs(n):
+        return n * (n - 1) // 2
+    predicted = sum(pairs(len(group)) for group in groups)
+    correct = 0
+    for group in groups:
+        counts = {}
+        for path in group:
+            counts[truth.get(path)] = counts.get(truth.get(path), 0) + 1
+        correct += sum(pairs(n) for origin, n in counts.items() if origin is not None)
+    sizes = {}
+    for origin in truth.values():
+        sizes[origin] = sizes.get(origin, 0) + 1
+    expected = sum(pairs(n) for n in sizes.values())
+    precision = correct / predicted if predicted else 1.0
+    recall = correct / expected if expected else 1.0
+    return round(precision, 4), round(recall, 4)
+
+def run_benchmark(folder, thresholds=range(21), workers=None, algorithm="phash",
+                  verify=None, dihedral=None, grouping="bands", decode=("draft",), prefetch=0,
+                  draft_tolerance=DRAFT_TOLERANCE):
+    """Mide cada fase de la búsqueda en ``folder`` y devuelve un diccionario serializable.
+
+    Las fases se miden por separado: listado de carpetas, decodificación y
+    hash (en un pool de procesos, con el tiempo de cada parte sumado en los
+    procesos), agrupación en cada umbral y construcción del ``ResultStore``.
+    Cada modo de ``decode`` corre en un proceso nuevo con su propia memoria
+    máxima; con ``"draft"`` y ``"full"`` se comprueba además que los hashes
+    reducidos no se alejan de los completos más que el radio del umbral
+    ``draft_tolerance``.
+    Aparte se cronometra una búsqueda completa sin caché, la misma que hace
+    la interfaz, con ``prefetch`` lecturas anticipadas (para ajustarlo a
+    cada unidad de red).
+    """
+    folder = os.path.abspath(folder)
+    workers = workers or os.cpu_count() or 1
+    truth = None
+    truth_path = os.path.join(folder, TRUTH_FILE)
+    if os.path.exists(truth_path):
+        with open(truth_path, encoding="utf-8") as f:
+            truth = {os.path.normpath(path): origin for path, origin in json.load(f)["files"].items()}
+
+    options = dict(workers=workers, use_cache=False, grouping=grouping,
+                   algorithm=algorithm, verify=verify, dihedral=dihedral)
+    scanner = Scanner(folder, 5, **options)
+    phases = {}
+
+    start = time.perf_counter()
+    entries = list(scanner.scan_entries())
+    phases["enumeration"] = {"seconds": time.perf_counter() - start}
+    paths = [path for path, _ in entries]
+    total_bytes = sum(st.st_size for _, st in entries)
+
+    stats = {path: st for path, st in entries}
+    hashes = {}
+    for mode in decode:
+        result = run_decode_pass(paths, scanner.algorithms, dihedral, mode == "draft", workers)
+        hashes[mode] = result["hashes"]
+        wall = result["seconds"]
+        phases[f"decode_hash_{mode}"] = {
+            "seconds": wall,
+            "decode_cpu_seconds": result["decode_cpu_seconds"],
+            "hash_cpu_seconds": result["hash_cpu_seconds"],
+            "files_per_second": len(paths) / wall if wall else None,
+            "mb_per_second": total_bytes / 2 ** 20 / wall if wall else None,
+            "peak_rss_mb": result["peak_rss_mb"],
+        }
+    stability = None
+    if "draft" in hashes and "full" in hashes:
+        stability = draft_stability(scanner, hashes["full"], hashes["draft"], draft_tolerance)
+
+    # Se agrupa con los hashes del primer modo, el que usa la búsqueda
+    images = {}
+    for path, h in hashes[decode[0]].items():
+        images.setdefault(h, []).append(path)
+
+    per_threshold = []
+    for threshold in thresholds:
+        grouper = Scanner(folder, threshold, **options)
+        start = time.perf_counter()
+        groups = grouper.components(list(images))
+        seconds = time.perf_counter() - start
+        row = {"threshold": threshold, "radius": grouper.radius, "seconds": seconds,
+               "candidate_pairs": grouper.candidate_pairs, "confirmed_pairs": grouper.confirmed_pairs}
+        files = [[path for h in members for path in images[h]] for members in groups]
+        row["groups"] = sum(1 for group in files if len(group) > 1)
+        if truth is not None:
+            row["precision"], row["recall"] = pair_scores(
+                [[os.path.relpath(path, folder) for path in group] for group in files], truth)
+        per_threshold.append(row)
+    phases["grouping"] = {"seconds": sum(row["seconds"] for row in per_threshold)}
+
+    # Construcción del resultado con el umbral por defecto de la interfaz
+    state = ScanState(folder, False, scanner.radius, scanner.hash_key)
+    state.images = images
+    for h, files in images.items():
+        for path in files:
+            st = stats[path]
+            state.entries[path] = (st.st_size, st.st_mtime_ns, st.st_ino, h, 0, 0)
+    for members in scanner.components(list(images)):
+        state.new_group(members)
+    start = time.perf_counter()
+    store = state.results()
+    phases["results"] = {"seconds": time.perf_counter() - start, "groups": len(store),
+                         "files": store.file_count}
+
+    full = Scanner(folder, 5, prefetch=prefetch, **options)
+    start = time.perf_counter()
+    full.run()
+    wall = time.perf_counter() - start
+    phases["scan"] = {"seconds": wall, "files_per_second": len(paths) / wall if wall else None,
+                      "mb_per_second": total_bytes / 2 ** 20 / wall if wall else None,
+                      "profile": full.profile.to_dict()}
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {"workers": workers, "algorithm": algorithm, "verify": verify,
+                    "dihedral": dihedral, "grouping": grouping, "prefetch": prefetch},
+        "corpus": {"folder": folder, "files": len(paths), "bytes": total_bytes,
+                   "ground_truth": truth is not None},
+        "phases": phases,
+        "thresholds": per_threshold,
+        "draft_stability": stability,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def parse_importtime(stderr, module):
+    """Tiempo total de ``module`` y de sus importaciones directas, en ms, según ``-X importtime``."""
+    total = None
+    children = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Cada nivel de anidamiento añade dos espacios delante del nombre
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        ms = int(cumulative) / 1000
+        if depth == 1:
+            children.append((name, ms))
+        elif depth == 0:
+            if name == module:
+                total = ms
+                break
+            children = []
+    children.sort(key=lambda item: item[1], reverse=True)
+    return total, children
+
+def measure_startup(module="duplicados", repeat=5):
+    """Importa ``module`` en ``repeat`` intérpretes nuevos y se queda con el más rápido."""
+    code = (f"import sys, json, {module}; "
+            f"print(json.dumps(sorted(m for m in {LAZY_MODULES!r} if m in sys.modules)))")
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True)
+        total, children = parse_importtime(proc.stderr, module)
+        if best is None or total < best["milliseconds"]:
+            best = {
+                "module": module,
+                "milliseconds": round(total, 1),
+                "imports": {name: round(ms, 1) for name, ms in children[:10]},
+                "loaded": json.loads(proc.stdout),
+            }
+    return best
+
+def compare(old, new, out=sys.stderr):
+    """Escribe la diferencia de tiempos y de precisión entre dos resultados."""
+    print(f"{'fase':<22}{'antes':>10}{'ahora':>10}{'cambio':>9}", file=out)
+    for phase, values in new["phases"].items():
+        before = old["phases"].get(phase, {}).get("seconds")
+        now = values["seconds"]
+        change = f"{(now / before - 1) * 100:+.0f}%" if before else "-"
+        print(f"{phase:<22}{before if before is not None else float('nan'):>10.3f}{now:>10.3f}{change:>9}",
+              file=out)
+    old_rows = {row["threshold"]: row for row in old.get("thresholds", [])}
+    for row in new["thresholds"]:
+        before = old_rows.get(row["threshold"])
+        if before and "precision" in row and "precision" in before:
+            if (before["precision"], before["recall"]) != (row["precision"], row["recall"]):
+                print(f"umbral {row['threshold']}: precisión {before['precision']} -> {row['precision']}, "
+                      f"exhaustividad {before['recall']} -> {row['recall']}", file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark",
+        description="Genera colecciones sintéticas y mide el rendimiento de la búsqueda.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="generar una colección sintética")
+    gen.add_argument("folder", help="carpeta donde crear la colección")
+    gen.add_argument("--originals", type=int, default=200, help="imágenes originales (por defecto 200)")
+    gen.add_argument("--seed", type=int, default=0, help="semilla (por defecto 0)")
+    gen.add_argument("--size", default="640x480", help="tamaño de los originales (por defecto 640x480)")
+    gen.add_argument("--variants", default=",".join(VARIANTS),
+                     help=f"casi duplicados a generar, separados por comas (por defecto {','.join(VARIANTS)})")
+
+    run = commands.add_parser("run", help="medir la búsqueda sobre una colección")
+    run.add_argument("folder", help="carpeta a analizar")
+    run.add_argument("-o", "--output", help="archivo JSON de resultados (por defecto la salida estándar)")
+    run.add_argument("--compare", help="resultado JSON anterior con el que comparar")
+    run.add_argument("--thresholds", default="0-20",
+                     help="umbrales a evaluar, como 0-20 o 0,5,10 (por defecto 0-20)")
+    run.add_argument("--workers", type=int, help="procesos para calcular hashes")
+    run.add_argument("--algorithm", choices=tuple(HASH_ALGORITHMS), default="phash")
+    run.add_argument("--verify", choices=VERIFY_METHODS)
+    run.add_argument("--dihedral", choices=DIHEDRAL_MODES)
+    run.add_argument("--grouping", choices=Scanner.GROUPING_BACKENDS, default="bands")
+    run.add_argument("--full-decode", action="store_true",
+                     help="medir también la decodificación completa, sin reducir los JPEG, "
+                          "y comprobar que los hashes reducidos se parecen a los completos")
+    run.add_argument("--draft-tolerance", type=int, default=DRAFT_TOLERANCE,
+                     help="umbral cuyo radio no deben pasar los hashes reducidos respecto a los "
+                          f"completos (por defecto {DRAFT_TOLERANCE})")
+    run.add_argument("--prefetch", type=int, default=0,
+                     help="lecturas anticipadas en vuelo en la búsqueda completa (por defecto 0)")
+
+    startup = commands.add_parser("startup", help="medir el tiempo de importación de la interfaz")
+    startup.add_argument("--budget", type=float, default=STARTUP_BUDGET_MS,
+                         help=f"máximo en milisegundos (por defecto {STARTUP_BUDGET_MS})")
+    startup.add_argument("--repeat", type=int, default=5, help="repeticiones (por defecto 5)")
+    args = parser.parse_args(argv)
+
+    if args.command == "startup":
+        result = measure_startup(repeat=args.repeat)
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        status = 0
+        if result["milliseconds"] > args.budget:
+            print(f"La importación tarda {result['milliseconds']} ms; el presupuesto es {args.budget:g} ms",
+                  file=sys.stderr)
+            status = 1
+        if result["loaded"]:
+            print(f"Se importan al arrancar: {', '.join(result['loaded'])}", file=sys.stderr)
+            status = 1
+        return status
+
+    if args.command == "generate":
+        variants = tuple(v for v in args.variants.split(",") if v)
+        unknown = set(variants) - set(VARIANTS)
+        if unknown:
+            parser.error(f"variantes desconocidas: {', '.join(sorted(unknown))}")
+        width, height = (int(x) for x in args.size.lower().split("x"))
+        truth = generate_corpus(args.folder, args.originals, args.seed, (width, height), variants)
+        print(f"{len(truth)} imágenes en {args.folder}", file=sys.stderr)
+        return 0
+
+    if not os.path.isdir(args.folder):
+        parser.error(f"no existe la carpeta {args.folder}")
+    if "-" in args.thresholds:
+        low, high = (int(x) for x in args.thresholds.split("-"))
+        thresholds = range(low, high + 1)
+    else:
+        thresholds = [int(x) for x in args.thresholds.split(",")]
+    decode = ("draft", "full") if args.full_decode else ("draft",)
+    result = run_benchmark(args.folder, thresholds, args.workers, args.algorithm,
+                           args.verify, args.dihedral, args.grouping, decode, args.prefetch,
+                           args.draft_tolerance)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(result, out, indent=2)
+            out.write("\n")
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), result)
+    stability = result["draft_stability"]
+    if stability and stability["outside"]:
+        print(f"{len(stability['outside'])} de {stability['files']} archivos cambian de hash más que "
+              f"el radio del umbral {stability['tolerance_threshold']} al reducir la decodificación",
+              file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
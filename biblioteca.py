@@ -0,0 +1,327 @@
+"""Índice de hashes de una biblioteca de imágenes, sin dependencias de Qt.
+
+Responde a "¿cuáles de estas imágenes nuevas ya están en el archivo?" sin
+volver a recorrer el archivo: ``IndexBuilder`` calcula una vez los hashes
+de la biblioteca y los guarda en arrays de NumPy que se abren con
+``mmap``, y ``LibraryQuery`` solo lee las imágenes del lote nuevo::
+
+    python -m biblioteca index BIBLIOTECA [--index RUTA] [--algorithm phash]
+    python -m biblioteca query BIBLIOTECA LOTE [--threshold N] [--rotations] [--format json|csv]
+"""
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+import numpy as np
+from escaner import (
+    Scanner, HASH_ALGORITHMS, FILE_INFO_DTYPE, ResultStore, default_cache_path,
+    popcount64, primary_hash
+)
+
+INDEX_VERSION = 1
+# Archivo con los datos del índice; se escribe el último, al terminar
+META_FILE = "indice.json"
+
+def default_index_path(folder):
+    """Carpeta del índice de ``folder``, junto a la caché de hashes."""
+    key = os.path.normcase(os.path.abspath(folder)).encode("utf-8", "surrogateescape")
+    name = hashlib.blake2b(key, digest_size=8).hexdigest()
+    return os.path.join(os.path.dirname(default_cache_path()), "bibliotecas", name)
+
+def resolve_index_path(path):
+    # Se acepta la carpeta del índice o la de la biblioteca indexada
+    if os.path.exists(os.path.join(path, META_FILE)):
+        return path
+    return default_index_path(path)
+
+class LibraryIndex:
+    """Hashes de una biblioteca guardados en archivos ``.npy``.
+
+    Cada imagen tiene un id: su hash está en ``hashes`` (uint64), su tamaño,
+    fecha y dimensiones en ``info`` (``FILE_INFO_DTYPE``) y su ruta, en
+    UTF-8, en ``names[offsets[i]:offsets[i + 1]]``. Los arrays se abren con
+    ``mmap``: abrir un índice de millones de imágenes no lee nada hasta la
+    primera consulta, y el sistema comparte las páginas entre procesos.
+    """
+    ARRAYS = ("hashes", "info", "offsets", "names")
+    # Consultas y hashes del índice por bloque: 64 x 32768 x 8 bytes = 16 MB
+    QUERY_TILE = 64
+    INDEX_CHUNK = 32768
+
+    def __init__(self, path):
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"El índice {path} es de otra versión; hay que volver a crearlo")
+        self.path = path
+        self.folder = meta["folder"]
+        self.algorithm = meta["algorithm"]
+        self.exclude_subfolders = meta["exclude_subfolders"]
+        self.created = meta["created"]
+        # Un array vacío no se puede proyectar en memoria
+        mmap_mode = "r" if meta["files"] else None
+        for name in self.ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode))
+        if len(self.hashes) != meta["files"]:
+            raise ValueError(f"El índice {path} está incompleto; hay que volver a crearlo")
+
+    @classmethod
+    def write(cls, path, folder, algorithm, exclude_subfolders, entries):
+        """Guarda las entradas de un ``ScanState`` como índice en ``path``."""
+        os.makedirs(path, exist_ok=True)
+        paths = sorted(entries)
+        encoded = [p.encode("utf-8", "surrogateescape") for p in paths]
+        offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        arrays = {
+            "hashes": np.array([primary_hash(entries[p][3]) for p in paths], dtype=np.uint64),
+            "info": np.array([(e[0], e[1], e[4], e[5]) for e in map(entries.get, paths)],
+                             dtype=FILE_INFO_DTYPE),
+            "offsets": offsets,
+            "names": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        }
+        # Cada archivo se escribe aparte y se renombra encima del anterior;
+        # el índice solo vale cuando indice.json coincide con los arrays
+        for name, array in arrays.items():
+            tmp = os.path.join(path, name + ".npy.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, os.path.join(path, name + ".npy"))
+        meta = {
+            "version": INDEX_VERSION,
+            "folder": folder,
+            "algorithm": algorithm,
+            "exclude_subfolders": exclude_subfolders,
+            "files": len(paths),
+            "created": time.time(),
+        }
+        tmp = os.path.join(path, META_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, os.path.join(path, META_FILE))
+        return cls(path)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def file_path(self, i):
+        return bytes(self.names[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8", "surrogateescape")
+
+    def entry(self, i):
+        # Con la forma de las entradas de ``ScanState``, para ``ResultStore``
+        size, mtime_ns, width, height = self.info[i].tolist()
+        return size, mtime_ns, 0, int(self.hashes[i]), width, height
+
+    def search(self, values, radius):
+        """Busca en el índice los hashes a distancia <= ``radius`` de cada valor.
+
+        Cada valor es un hash o una tupla de hashes (las 8 orientaciones de
+        la imagen), y vale la menor distancia. Devuelve, por valor, una lista
+        de ``(id, distancia)`` de menor a mayor distancia. El índice se
+        recorre por bloques, con XOR y conteo de bits vectorizados.
+        """
+        queries = [v if isinstance(v, tuple) else (v,) for v in values]
+        flat = np.array([h for q in queries for h in q], dtype=np.uint64)
+        owner = np.repeat(np.arange(len(queries)), [len(q) for q in queries])
+        found = [{} for _ in queries]
+        for start in range(0, len(self), self.INDEX_CHUNK):
+            chunk = np.asarray(self.hashes[start:start + self.INDEX_CHUNK])
+            for row in range(0, len(flat), self.QUERY_TILE):
+                distances = popcount64(flat[row:row + self.QUERY_TILE, None] ^ chunk[None, :])
+                ii, jj = np.nonzero(distances <= radius)
+                for q, i, d in zip(owner[ii + row].tolist(), (jj + start).tolist(),
+                                   distances[ii, jj].tolist()):
+                    best = found[q].get(i)
+                    if best is None or d < best:
+                        found[q][i] = d
+        return [sorted(matches.items(), key=lambda item: (item[1], item[0])) for matches in found]
+
+class IndexBuilder:
+    """Calcula los hashes de una biblioteca y los guarda como ``LibraryIndex``.
+
+    Usa el ``Scanner`` de siempre sin agrupar, así que aprovecha la caché
+    de hashes: volver a indexar solo lee las imágenes nuevas o modificadas.
+    ``run`` devuelve el índice, o ``None`` si se canceló con ``stop``.
+    """
+
+    def __init__(self, folder, path=None, algorithm="phash", exclude_subfolders=False, **options):
+        self.folder = os.path.abspath(folder)
+        self.path = path or default_index_path(self.folder)
+        self.algorithm = algorithm
+        self.exclude_subfolders = exclude_subfolders
+        self.scanner = Scanner(self.folder, 0, exclude_subfolders, algorithm=algorithm, **options)
+
+    @property
+    def is_running(self):
+        return self.scanner.is_running
+
+    def run(self):
+        if not self.scanner.hash_all():
+            return None
+        return LibraryIndex.write(self.path, self.folder, self.algorithm,
+                                  self.exclude_subfolders, self.scanner.state.entries)
+
+    def stop(self):
+        self.scanner.stop()
+
+class LibraryQuery:
+    """Busca en un ``LibraryIndex`` las imágenes de la carpeta ``folder``.
+
+    Solo se leen (o se toman de la caché) las imágenes del lote, con el
+    mismo algoritmo que el índice; la biblioteca no se toca. Con
+    ``rotations`` cada imagen busca también con sus giros y espejos.
+    ``run`` devuelve ``{ruta del lote: [(ruta de la biblioteca, distancia)]}``
+    solo con las que tienen coincidencias, o ``None`` si se canceló.
+    """
+
+    def __init__(self, index, folder, threshold=5, rotations=False, exclude_subfolders=False,
+                 **options):
+        self.index = index
+        self.scanner = Scanner(folder, threshold, exclude_subfolders, algorithm=index.algorithm,
+                               dihedral="probe" if rotations else None, **options)
+        self.queried = 0
+        self.search_time = 0.0
+        self.found = {}  # ruta del lote -> [(id en el índice, distancia)]
+
+    @property
+    def is_running(self):
+        return self.scanner.is_running
+
+    def run(self):
+        if not self.scanner.hash_all():
+            return None
+        entries = self.scanner.state.entries
+        paths = sorted(entries)
+        start = time.perf_counter()
+        results = self.index.search([entries[p][3] for p in paths], self.scanner.radius)
+        self.search_time = time.perf_counter() - start
+        self.queried = len(paths)
+        self.found = {path: found for path, found in zip(paths, results) if found}
+        return {path: [(self.index.file_path(i), d) for i, d in found]
+                for path, found in self.found.items()}
+
+    def results(self):
+        """``ResultStore`` con un grupo por imagen del lote: ella y después sus coincidencias.
+
+        La biblioteca hace de referencia y el lote de candidato, como en
+        ``SetComparison``.
+        """
+        entries = dict(self.scanner.state.entries)
+        roles = dict.fromkeys(self.found, "candidate")
+        groups = []
+        for path, found in self.found.items():
+            group = [(primary_hash(entries[path][3]), path)]
+            for i, _ in found:
+                library_path = self.index.file_path(i)
+                entries.setdefault(library_path, self.index.entry(i))
+                roles.setdefault(library_path, "reference")
+                group.append((int(self.index.hashes[i]), library_path))
+            groups.append(group)
+        return ResultStore.from_groups(groups, entries, roles)
+
+    def stop(self):
+        self.scanner.stop()
+
+def write_json(matches, out):
+    files = [{"file": path, "matches": [{"path": p, "distance": d} for p, d in found]}
+             for path, found in matches.items()]
+    json.dump({"files": files}, out, ensure_ascii=False, indent=2)
+    out.write("\n")
+
+def write_csv(matches, out):
+    writer = csv.writer(out)
+    writer.writerow(["file", "library_path", "distance"])
+    for path, found in matches.items():
+        for library_path, d in found:
+            writer.writerow([path, library_path, d])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m biblioteca",
+        description="Indexa una biblioteca de imágenes y busca en ella las imágenes de un lote nuevo.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index = commands.add_parser("index", help="crear o actualizar el índice de una biblioteca")
+    index.add_argument("library", help="carpeta de la biblioteca")
+    index.add_argument("--index", help="carpeta del índice (por defecto junto a la caché de hashes)")
+    index.add_argument("--algorithm", choices=tuple(HASH_ALGORITHMS), default="phash",
+                       help="hash perceptual del índice (por defecto phash)")
+    index.add_argument("--exclude-subfolders", action="store_true", help="indexar solo la carpeta principal")
+
+    query = commands.add_parser("query", help="buscar en el índice las imágenes de un lote")
+    query.add_argument("library", help="carpeta de la biblioteca indexada, o la del índice")
+    query.add_argument("batch", help="carpeta con las imágenes nuevas")
+    query.add_argument("--threshold", type=int, default=5,
+                       help="tolerancia de 0 (exacto) a 20 (muy permisivo) (por defecto 5)")
+    query.add_argument("--rotations", action="store_true", help="buscar también copias giradas o en espejo")
+    query.add_argument("--exclude-subfolders", action="store_true", help="consultar solo la carpeta principal del lote")
+    query.add_argument("--format", choices=("json", "csv"), default="json",
+                       help="formato de salida (por defecto json)")
+    query.add_argument("-o", "--output", help="archivo de salida (por defecto la salida estándar)")
+
+    for command in (index, query):
+        command.add_argument("--workers", type=int, help="procesos para calcular hashes")
+        command.add_argument("--prefetch", type=int, default=0, metavar="N",
+                             help="lecturas anticipadas en vuelo, para unidades de red")
+        command.add_argument("--no-cache", action="store_true", help="no usar la caché de hashes")
+        command.add_argument("--cache-path", help="ruta del archivo de caché de hashes")
+    args = parser.parse_args(argv)
+
+    options = dict(workers=args.workers, prefetch=args.prefetch,
+                   use_cache=not args.no_cache, cache_path=args.cache_path)
+    if args.command == "index":
+        if not os.path.isdir(args.library):
+            parser.error(f"no existe la carpeta {args.library}")
+        builder = IndexBuilder(args.library, args.index, args.algorithm,
+                               args.exclude_subfolders, **options)
+        try:
+            built = builder.run()
+        except KeyboardInterrupt:
+            builder.stop()
+            return 130
+        if built is None:
+            return 130
+        print(f"{len(built)} imágenes indexadas en {built.path}", file=sys.stderr)
+        return 0
+
+    if not os.path.isdir(args.batch):
+        parser.error(f"no existe la carpeta {args.batch}")
+    if not 0 <= args.threshold <= 20:
+        parser.error("--threshold debe estar entre 0 y 20")
+    path = resolve_index_path(args.library)
+    try:
+        library = LibraryIndex(path)
+    except FileNotFoundError:
+        parser.error(f"no hay índice de {args.library}; créalo con: python -m biblioteca index {args.library}")
+    except ValueError as e:
+        parser.error(str(e))
+    lookup = LibraryQuery(library, args.batch, args.threshold, args.rotations,
+                          args.exclude_subfolders, **options)
+    try:
+        matches = lookup.run()
+    except KeyboardInterrupt:
+        lookup.stop()
+        return 130
+    if matches is None:
+        return 130
+    per_image = lookup.search_time / lookup.queried * 1000 if lookup.queried else 0.0
+    print(f"{len(matches)} de {lookup.queried} imágenes ya están en la biblioteca "
+          f"({len(library)} indexadas); búsqueda: {lookup.search_time * 1000:.1f} ms, "
+          f"{per_image:.2f} ms por imagen", file=sys.stderr)
+
+    write = write_json if args.format == "json" else write_csv
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as out:
+            write(matches, out)
+    else:
+        write(matches, sys.stdout)
+    return 0
+
+if __name__ == "__main__":
+    # Necesario para el pool de procesos en ejecutables congelados
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,171 +1,317 @@
 import os
 import sys
-import imagehash
-from PIL import Image
-import io
-import subprocess
-from send2trash import send2trash
+import multiprocessing
+import hashlib
+import numpy as np
+from collections import OrderedDict
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QFileDialog,
-    QListWidget, QListWidgetItem, QSlider, QMessageBox, QHBoxLayout, QAbstractItemView,
-    QScrollArea, QFrame, QSizePolicy, QGroupBox, QGridLayout, QSplitter, QCheckBox,
-    QDialog, QComboBox
+    QSlider, QMessageBox, QHBoxLayout, QAbstractItemView,
+    QScrollArea, QGroupBox, QGridLayout, QSplitter, QCheckBox,
+    QDialog, QComboBox, QListView, QStyledItemDelegate, QInputDialog
 )
-from PyQt5.QtGui import QIcon, QPixmap, QFont, QPalette, QColor, QPainter, QPen
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QObject, QSize, QRect, QTimer
+from PyQt5.QtGui import QPixmap, QImage, QFont, QColor, QPainter, QPen
+from PyQt5.QtCore import (
+    Qt, QThread, pyqtSignal, QObject, QSize, QRect, QTimer, QFileSystemWatcher,
+    QRunnable, QThreadPool, QAbstractListModel, QModelIndex, QEvent
+)
+from escaner import (
+    Scanner, SetComparison, ResultStore, HASH_ALGORITHMS, VERIFY_METHODS, ROLES, open_reduced,
+    default_cache_path
+)
+from operaciones import BulkOperation, OperationReport
+from biblioteca import IndexBuilder, LibraryIndex, LibraryQuery, resolve_index_path
 
 class Worker(QObject):
-    finished = pyqtSignal(dict)
+    """Ejecuta un ``Scanner`` en un QThread y traduce su resultado a señales."""
+    finished = pyqtSignal(object)
     progress = pyqtSignal(int)
+    stats = pyqtSignal(object)  # resumen de ScanProfile.snapshot
     error = pyqtSignal(str)
     cancelled = pyqtSignal() 
 
-    def __init__(self, folder, threshold, exclude_subfolders=False):
+    def __init__(self, folder, threshold, exclude_subfolders=False, regroup=False, **options):
         super().__init__()
-        self.folder = folder
-        self.threshold = threshold
-        self.exclude_subfolders = exclude_subfolders
-        self._isRunning = True
+        # Con ``regroup`` solo se vuelven a agrupar los hashes de ``previous``
+        self.regroup = regroup
+        self.scanner = Scanner(folder, threshold, exclude_subfolders,
+                               progress=self.progress.emit, stats=self.stats.emit, **options)
 
     def run(self):
-        images = {}
         try:
-            # Contar archivos primero para progreso
-            if self.exclude_subfolders:
-                total_files = sum(1 for f in os.listdir(self.folder) 
-                                 if os.path.isfile(os.path.join(self.folder, f)) and 
-                                 f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')))
-            else:
-                total_files = sum(1 for _, _, files in os.walk(self.folder) 
-                                 for f in files if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')))
-            processed = 0
-            
-            if self.exclude_subfolders:
-                # Procesar solo la carpeta principal
-                for f in os.listdir(self.folder):
-                    if not self._isRunning:
-                        break
-                        
-                    file_path = os.path.join(self.folder, f)
-                    if os.path.isfile(file_path) and f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
-                        try:
-                            img = Image.open(file_path)
-                            h = imagehash.phash(img)
-                            images.setdefault(h, []).append(file_path)
-                            processed += 1
-                            self.progress.emit(int((processed / total_files) * 100))
-                        except Exception as e:
-                            print(f"Error con {file_path}: {e}")
-            else:
-                # Procesar incluyendo subcarpetas
-                for root, _, files in os.walk(self.folder):
-                    if not self._isRunning:
-                        break
-                        
-                    for f in files:
-                        if not self._isRunning:
-                            break
-                            
-                        if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
-                            path = os.path.join(root, f)
-                            try:
-                                img = Image.open(path)
-                                h = imagehash.phash(img)
-                                images.setdefault(h, []).append(path)
-                                processed += 1
-                                self.progress.emit(int((processed / total_files) * 100))
-                            except Exception as e:
-                                print(f"Error con {path}: {e}")
-            
-            # Si la búsqueda fue cancelada, no continuar con el procesamiento
-            if not self._isRunning:
-                self.cancelled.emit()
-                self.finished.emit({})
-                return
-            
-            # Algoritmo optimizado para agrupar hashes similares
-            # Convertir el diccionario a una lista de hashes
-            hashes = list(images.keys())
-            n = len(hashes)
-            
-            # Inicializar el arreglo de padres para el union-find
-            parent = list(range(n))
-            rank = [0] * n
-            
-            # Función para encontrar la raíz de un elemento
-            def find(x):
-                if parent[x] != x:
-                    parent[x] = find(parent[x])
-                return parent[x]
-            
-            # Función para unir dos conjuntos
-            def union(x, y):
-                rx, ry = find(x), find(y)
-                if rx == ry:
-                    return
-                if rank[rx] < rank[ry]:
-                    parent[rx] = ry
-                elif rank[rx] > rank[ry]:
-                    parent[ry] = rx
-                else:
-                    parent[ry] = rx
-                    rank[rx] += 1
-            
-            # Comparar todos los pares de hashes
-            for i in range(n):
-                if not self._isRunning:
-                    break
-                for j in range(i + 1, n):
-                    if not self._isRunning:
-                        break
-                    scaled_threshold = self.threshold * 3  
-                    if abs(hashes[i] - hashes[j]) <= scaled_threshold:
-                        union(i, j)
-            
-            # Si la búsqueda fue cancelada, no continuar con el procesamiento
-            if not self._isRunning:
-                self.cancelled.emit()
-                self.finished.emit({})
-                return
-            
-            # Recopilar los grupos
-            groups = {}
-            for i in range(n):
-                if not self._isRunning:
-                    break
-                root = find(i)
-                if root not in groups:
-                    groups[root] = []
-                groups[root].append(hashes[i])
-            
-            # Crear el diccionario de duplicados
-            duplicates = {}
-            for root, group_hashes in groups.items():
-                if not self._isRunning:
-                    break
-                all_files = []
-                for h in group_hashes:
-                    all_files.extend(images[h])
-                
-                if len(all_files) > 1:
-                    duplicates[group_hashes[0]] = all_files
-            
-            # Si la búsqueda fue cancelada, no continuar con el procesamiento
-            if not self._isRunning:
-                self.cancelled.emit()
-                self.finished.emit({})
-                return
-            
-            self.finished.emit(duplicates)
+            duplicates = self.scanner.regroup() if self.regroup else self.scanner.run()
         except Exception as e:
             self.error.emit(f"Error procesando imágenes: {str(e)}")
-            self.finished.emit({})
+            self.finished.emit(ResultStore.from_groups([]))
+            return
+
+        # Si la búsqueda fue cancelada, no continuar con el procesamiento
+        if duplicates is None:
+            self.cancelled.emit()
+            self.finished.emit(ResultStore.from_groups([]))
+            return
+
+        self.finished.emit(self.scanner.state.results())
 
     def stop(self):
-        if self._isRunning:
-            self._isRunning = False
+        if self.scanner.is_running:
+            self.scanner.stop()
             self.cancelled.emit()  # Emitir señal de cancelación
 
+class OperationWorker(QObject):
+    """Ejecuta una ``BulkOperation`` (papelera, mover o enlazar) en un QThread."""
+    finished = pyqtSignal(object)
+    progress = pyqtSignal(int)
+
+    def __init__(self, paths, action, destination=None, keep=None):
+        super().__init__()
+        self.operation = BulkOperation(paths, action, destination,
+                                       progress=self.progress.emit, keep=keep)
+
+    def run(self):
+        try:
+            report = self.operation.run()
+        except Exception as e:
+            report = OperationReport()
+            report.errors.append(("", str(e)))
+        self.finished.emit(report)
+
+    def stop(self):
+        self.operation.stop()
+
+class TaskWorker(QObject):
+    """Ejecuta en un QThread una tarea con ``run``, ``stop`` e ``is_running``.
+
+    Sirve para indexar una biblioteca (``IndexBuilder``), consultar su
+    índice (``LibraryQuery``) o comparar dos carpetas (``SetComparison``).
+    """
+    finished = pyqtSignal(object)  # el índice, las coincidencias, los grupos o None
+    progress = pyqtSignal(int)
+    error = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, task_class, *args, **options):
+        super().__init__()
+        self.task = task_class(*args, progress=self.progress.emit, **options)
+
+    def run(self):
+        try:
+            result = self.task.run()
+        except Exception as e:
+            self.error.emit(f"Error procesando imágenes: {str(e)}")
+            self.finished.emit(None)
+            return
+        if result is None:
+            self.cancelled.emit()
+        self.finished.emit(result)
+
+    def stop(self):
+        if self.task.is_running:
+            self.task.stop()
+            self.cancelled.emit()
+
+def pil_to_qimage(img):
+    # Conversión directa en memoria, sin codificar a PNG y volver a decodificar
+    img = img.convert("RGBA")
+    data = img.tobytes("raw", "RGBA")
+    qimage = QImage(data, img.width, img.height, img.width * 4, QImage.Format_RGBA8888)
+    return qimage.copy()  # QImage no es dueño de ``data``
+
+class ThumbnailCache:
+    """Caché de miniaturas en memoria (LRU) y en disco.
+
+    La clave es (ruta, mtime_ns, tamaño en bytes, lado de la miniatura), así
+    que una imagen modificada genera una miniatura nueva. En memoria se
+    guardan QPixmap hasta ``MEMORY_LIMIT`` bytes; en disco, archivos PNG
+    que se recortan por antigüedad al pasar de ``DISK_LIMIT`` bytes.
+    """
+    MEMORY_LIMIT = 128 * 1024 * 1024
+    DISK_LIMIT = 256 * 1024 * 1024
+
+    def __init__(self, folder=None):
+        self.folder = folder or os.path.join(os.path.dirname(default_cache_path()), "thumbnails")
+        self.pixmaps = OrderedDict()
+        self.memory_used = 0
+
+    @staticmethod
+    def key(path, size):
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_mtime_ns, st.st_size, size)
+
+    def disk_path(self, key):
+        name = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.folder, name[:2], name + ".png")
+
+    def load_image(self, key):
+        """Devuelve la miniatura como QImage, desde disco o decodificando el original."""
+        thumb_path = self.disk_path(key)
+        image = QImage(thumb_path)
+        if not image.isNull():
+            try:
+                # Marcar como usada para que el recorte sea por uso y no por creación
+                os.utime(thumb_path)
+            except OSError:
+                pass
+            return image
+        path, _, _, size = key
+        with open_reduced(path, size) as img:
+            img.thumbnail((size, size))
+            image = pil_to_qimage(img)
+        try:
+            os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+            # Escribir aparte y renombrar: nunca queda un PNG a medias
+            tmp_path = thumb_path + ".tmp"
+            if image.save(tmp_path, "PNG"):
+                os.replace(tmp_path, thumb_path)
+        except OSError as e:
+            print(f"No se pudo guardar la miniatura de {path}: {e}")
+        return image
+
+    def lookup(self, key):
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+        return pixmap
+
+    def get(self, path, size):
+        key = self.key(path, size)
+        pixmap = self.lookup(key)
+        if pixmap is not None:
+            return pixmap
+        pixmap = QPixmap.fromImage(self.load_image(key))
+        self.put(key, pixmap)
+        return pixmap
+
+    def put(self, key, pixmap):
+        if key in self.pixmaps:
+            return
+        self.pixmaps[key] = pixmap
+        self.memory_used += pixmap.width() * pixmap.height() * 4
+        while self.memory_used > self.MEMORY_LIMIT and len(self.pixmaps) > 1:
+            _, old = self.pixmaps.popitem(last=False)
+            self.memory_used -= old.width() * old.height() * 4
+
+    def trim_disk(self):
+        """Borra las miniaturas más antiguas hasta quedar bajo ``DISK_LIMIT``."""
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.DISK_LIMIT:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+thumbnail_cache = ThumbnailCache()
+
+class ThumbnailTask(QRunnable):
+    def __init__(self, loader, key):
+        super().__init__()
+        # El cargador conserva la referencia hasta que llega el resultado
+        self.setAutoDelete(False)
+        self.loader = loader
+        self.key = key
+
+    def run(self):
+        # QImage se puede usar fuera del hilo de la interfaz; QPixmap no
+        try:
+            image = thumbnail_cache.load_image(self.key)
+            error = ""
+        except Exception as e:
+            image = QImage()
+            error = str(e)
+        self.loader.task_done.emit(self.key, image, error)
+
+class ThumbnailLoader(QObject):
+    """Decodifica miniaturas en un QThreadPool y las entrega en el hilo de la interfaz.
+
+    Cada petición lleva un ``owner`` (el objeto que la pidió) y una función
+    que recibe ``(pixmap, error)``. Varias peticiones de la misma miniatura
+    comparten una sola tarea, y ``cancel(owner)`` retira de la cola las
+    tareas que ya nadie espera.
+    """
+    task_done = pyqtSignal(object, QImage, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.tasks = {}    # clave -> ThumbnailTask
+        self.waiting = {}  # clave -> [(owner, callback)]
+        self.task_done.connect(self.on_task_done)
+
+    def request(self, path, size, owner, callback, priority=0):
+        try:
+            key = thumbnail_cache.key(path, size)
+        except OSError as e:
+            callback(None, str(e))
+            return
+        self.request_key(key, owner, callback, priority)
+
+    def request_key(self, key, owner, callback, priority=0):
+        pixmap = thumbnail_cache.lookup(key)
+        if pixmap is not None:
+            callback(pixmap, "")
+            return
+        self.waiting.setdefault(key, []).append((owner, callback))
+        if key not in self.tasks:
+            task = ThumbnailTask(self, key)
+            self.tasks[key] = task
+            self.pool.start(task, priority)
+
+    def cancel(self, owner):
+        """Olvida las peticiones de ``owner``; devuelve cuántas quedaron sin servir."""
+        cancelled = 0
+        for key in list(self.waiting):
+            waiters = self.waiting[key]
+            remaining = [w for w in waiters if w[0] is not owner]
+            cancelled += len(waiters) - len(remaining)
+            if remaining:
+                self.waiting[key] = remaining
+                continue
+            del self.waiting[key]
+            # Si la tarea aún no empezó se saca de la cola; si ya empezó se
+            # deja terminar y su resultado queda en la caché
+            task = self.tasks.get(key)
+            if task is not None and self.pool.tryTake(task):
+                del self.tasks[key]
+        return cancelled
+
+    def on_task_done(self, key, image, error):
+        self.tasks.pop(key, None)
+        pixmap = None
+        if not image.isNull():
+            pixmap = QPixmap.fromImage(image)
+            thumbnail_cache.put(key, pixmap)
+        elif not error:
+            error = "imagen vacía"
+        for _, callback in self.waiting.pop(key, []):
+            callback(pixmap, error)
+
+    def shutdown(self):
+        self.waiting.clear()
+        self.pool.clear()
+        self.pool.waitForDone()
+
+_thumbnail_loader = None
+
+def thumbnail_loader():
+    global _thumbnail_loader
+    if _thumbnail_loader is None:
+        _thumbnail_loader = ThumbnailLoader()
+    return _thumbnail_loader
+
 class CustomSlider(QSlider):
     def __init__(self, orientation, parent=None):
         super().__init__(orientation, parent)
@@ -202,142 +348,235 @@ class CustomSlider(QSlider):
                 x = int((i / 20) * (width - 20)) + 10
                 painter.drawLine(x, height - 15, x, height - 10)
 
-class ImageGroupWidget(QWidget):
-    def __init__(self, files, parent=None, thumb_size=100, compact=False):
+FILES_ROLE = Qt.UserRole + 1
+COUNT_ROLE = Qt.UserRole + 2  # Tamaño del grupo, sin construir las rutas
+# Distintivo y nombre de cada lado al comparar conjuntos
+ROLE_BADGES = {"reference": ("A", "#fd7e14", "referencia"),
+               "candidate": ("B", "#6f42c1", "candidata")}
+
+class DuplicateGroupsModel(QAbstractListModel):
+    """Modelo de resultados sobre un ``ResultStore``: una fila por grupo.
+
+    La selección vive en el almacén y no en widgets, y las miniaturas se
+    piden solo cuando el delegado pinta una fila, es decir, solo para las
+    filas visibles. Los archivos se identifican por su id en el almacén.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = ResultStore.from_groups([])
+        self.thumb_keys = {}     # (id, lado) -> clave de ThumbnailCache
+        self.requested = set()   # (id, lado) con petición en curso
+        self.failed = set()      # (id, lado) que no se pudieron cargar
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.store)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == FILES_ROLE:
+            return [(i, self.store.path(i)) for i in self.store.group_ids(index.row())]
+        if role == COUNT_ROLE:
+            return self.store.group_size(index.row())
+        if role == Qt.ToolTipRole:
+            lines = []
+            for i in self.store.group_ids(index.row()):
+                badge = ROLE_BADGES.get(self.file_role(i))
+                lines.append(f"[{badge[0]}] {self.store.path(i)}" if badge else self.store.path(i))
+            return "\n".join(lines)
+        return None
+
+    def set_store(self, store):
+        self.cancel_thumbnails()
+        self.beginResetModel()
+        self.store = store
+        self.thumb_keys.clear()
+        self.failed.clear()
+        self.endResetModel()
+
+    def clear(self):
+        self.set_store(ResultStore.from_groups([]))
+
+    def group_changed(self, row):
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def all_changed(self):
+        if len(self.store):
+            self.dataChanged.emit(self.index(0), self.index(len(self.store) - 1))
+
+    def is_selected(self, i):
+        return self.store.selected[i]
+
+    def file_role(self, i):
+        return self.store.role(i)
+
+    def toggle(self, i):
+        self.store.toggle(i)
+        self.group_changed(int(self.store.group_of[i]))
+
+    def set_group_selection(self, row, ids):
+        self.store.set_group_selection(row, ids)
+        self.group_changed(row)
+
+    def select_all(self):
+        self.store.select_all()
+        self.all_changed()
+
+    def deselect_all(self):
+        self.store.deselect_all()
+        self.all_changed()
+
+    def keep_best(self, policy, pattern=None):
+        count = self.store.keep_best(policy, pattern)
+        self.all_changed()
+        return count
+
+    def invert_selection(self):
+        self.store.invert_selection()
+        self.all_changed()
+
+    def thumbnail(self, i, size):
+        """Devuelve la miniatura si ya está en memoria; si no, la pide y devuelve None."""
+        item = (i, size)
+        if item in self.failed:
+            return None
+        key = self.thumb_keys.get(item)
+        if key is None:
+            try:
+                key = thumbnail_cache.key(self.store.path(i), size)
+            except OSError as e:
+                self.on_thumbnail(item, None, str(e))
+                return None
+            self.thumb_keys[item] = key
+        pixmap = thumbnail_cache.lookup(key)
+        if pixmap is None and item not in self.requested:
+            self.requested.add(item)
+            thumbnail_loader().request_key(
+                key, self, lambda pixmap, error, item=item: self.on_thumbnail(item, pixmap, error))
+        return pixmap
+
+    def thumbnail_failed(self, i, size):
+        return (i, size) in self.failed
+
+    def on_thumbnail(self, item, pixmap, error):
+        self.requested.discard(item)
+        if pixmap is None:
+            print(f"No se pudo cargar miniatura de {self.store.path(item[0])}: {error}")
+            self.failed.add(item)
+        self.group_changed(int(self.store.group_of[item[0]]))
+
+    def cancel_thumbnails(self):
+        # Lo que siga visible se vuelve a pedir en el próximo repintado
+        thumbnail_loader().cancel(self)
+        self.requested.clear()
+
+class GroupDelegate(QStyledItemDelegate):
+    """Pinta un grupo como una fila de miniaturas seleccionables.
+
+    Sustituye al botón con dos etiquetas que antes se creaba por imagen:
+    solo se dibujan las filas visibles y un clic sobre una miniatura cambia
+    su selección en el modelo.
+    """
+    MARGIN = 10
+
+    def __init__(self, parent=None, thumb_size=100, compact=False):
         super().__init__(parent)
-        self.files = files
-        self.selected_files = set()
-        self.thumbnails_loaded = False
         self.thumb_size = thumb_size
         self.compact = compact
-        
-        self.layout = QVBoxLayout(self)
-        self.layout.setContentsMargins(5, 5, 5, 5)
-        self.layout.setSpacing(5)
-        
-        # Widget contenedor para las imágenes
-        self.images_container = QWidget()
-        self.images_layout = QHBoxLayout(self.images_container)
-        self.images_layout.setSpacing(6 if self.compact else 10)
-        self.images_layout.setAlignment(Qt.AlignLeft)
-        self.images_layout.setContentsMargins(0, 0, 0, 0)
-        
-        # Añadir cada imagen como un botón
-        self.image_buttons = []
-        for file_path in files:
-            self.add_image_button(file_path)
-        
-        # Ajustar el tamaño del contenedor al contenido
-        self.images_container.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
-        self.images_container.setMinimumHeight(self.thumb_size + (40 if not self.compact else 26))
-        
-        self.layout.addWidget(self.images_container)
-        
-        # Carga diferida de miniaturas después de un pequeño retraso
-        QTimer.singleShot(100, self.load_thumbnails)
-    
-    def add_image_button(self, file_path):
-        try:
-            btn = QPushButton()
-            btn.setFixedSize(self.thumb_size + 20, self.thumb_size + (40 if not self.compact else 26))
-            btn.setCheckable(True)
-            btn.clicked.connect(lambda checked, path=file_path: self.toggle_selection(path, checked))
-            
-            btn_layout = QVBoxLayout(btn)
-            btn_layout.setContentsMargins(5, 5, 5, 5)
-            btn_layout.setSpacing(3 if self.compact else 5)
-            
-            # Etiqueta para la imagen (inicialmente vacía)
-            img_label = QLabel()
-            img_label.setAlignment(Qt.AlignCenter)
-            img_label.setMinimumSize(self.thumb_size, self.thumb_size)
-            img_label.setMaximumSize(self.thumb_size, self.thumb_size)
-            img_label.setStyleSheet("background-color: #f0f0f0; border: 1px dashed #ccc;")
-            btn_layout.addWidget(img_label)
-            
-            # Etiqueta para el nombre del archivo
-            filename = os.path.basename(file_path)
+
+    def cell_size(self):
+        return QSize(self.thumb_size + 20, self.thumb_size + (26 if self.compact else 40))
+
+    def spacing(self):
+        return 6 if self.compact else 10
+
+    def cell_rect(self, row_rect, column):
+        cell = self.cell_size()
+        x = row_rect.x() + self.MARGIN + column * (cell.width() + self.spacing())
+        return QRect(x, row_rect.y() + self.MARGIN, cell.width(), cell.height())
+
+    def sizeHint(self, option, index):
+        count = index.data(COUNT_ROLE)
+        cell = self.cell_size()
+        width = 2 * self.MARGIN + count * cell.width() + max(0, count - 1) * self.spacing()
+        return QSize(width, cell.height() + 2 * self.MARGIN)
+
+    def paint(self, painter, option, index):
+        model = index.model()
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.fillRect(option.rect, QColor("#ffffff"))
+        font = QFont(painter.font())
+        font.setPixelSize(8 if self.compact else 9)
+        for column, (i, path) in enumerate(index.data(FILES_ROLE)):
+            rect = self.cell_rect(option.rect, column)
+            if rect.left() > option.rect.right():
+                break
+            selected = model.is_selected(i)
+            # Mismos colores que los botones marcables de la hoja de estilo
+            if selected:
+                painter.setPen(QPen(QColor("#1e7e34"), 3))
+                painter.setBrush(QColor("#28a745"))
+            else:
+                painter.setPen(Qt.NoPen)
+                painter.setBrush(QColor("#4a86e8"))
+            painter.drawRoundedRect(rect.adjusted(1, 1, -1, -1), 6, 6)
+
+            thumb_rect = QRect(rect.x() + 10, rect.y() + 5, self.thumb_size, self.thumb_size)
+            pixmap = model.thumbnail(i, self.thumb_size)
+            if pixmap is not None:
+                x = thumb_rect.x() + (thumb_rect.width() - pixmap.width()) // 2
+                y = thumb_rect.y() + (thumb_rect.height() - pixmap.height()) // 2
+                painter.drawPixmap(x, y, pixmap)
+            else:
+                painter.setPen(QPen(QColor("#cccccc"), 1, Qt.DashLine))
+                painter.setBrush(QColor("#f0f0f0"))
+                painter.drawRect(thumb_rect)
+                failed = model.thumbnail_failed(i, self.thumb_size)
+                painter.setPen(QColor("red") if failed else QColor("#999999"))
+                painter.drawText(thumb_rect, Qt.AlignCenter, "Error" if failed else "…")
+
+            badge = ROLE_BADGES.get(model.file_role(i))
+            if badge is not None:
+                # De qué conjunto viene el archivo al comparar dos carpetas
+                badge_rect = QRect(thumb_rect.x() + 2, thumb_rect.y() + 2, 18, 18)
+                painter.setPen(Qt.NoPen)
+                painter.setBrush(QColor(badge[1]))
+                painter.drawEllipse(badge_rect)
+                painter.setFont(font)
+                painter.setPen(QColor("#ffffff"))
+                painter.drawText(badge_rect, Qt.AlignCenter, badge[0])
+
+            filename = os.path.basename(path)
             if len(filename) > 15:
                 filename = filename[:12] + "..."
-            
-            name_label = QLabel(filename)
-            name_label.setWordWrap(True)
-            name_label.setAlignment(Qt.AlignCenter)
-            name_label.setStyleSheet("font-size: 9px;" if not self.compact else "font-size: 8px;")
-            btn_layout.addWidget(name_label)
-            
-            btn.file_path = file_path
-            btn.img_label = img_label
-            self.image_buttons.append(btn)
-            self.images_layout.addWidget(btn)
-        except Exception as e:
-            print(f"No se pudo crear botón para {file_path}: {e}")
-    
-    def load_thumbnails(self):
-        if self.thumbnails_loaded:
-            return
-            
-        self.thumbnails_loaded = True
-        for btn in self.image_buttons:
-            try:
-                file_path = btn.file_path
-                img = Image.open(file_path)
-                img.thumbnail((self.thumb_size, self.thumb_size))
-                buffer = io.BytesIO()
-                img.save(buffer, format="PNG")
-                pixmap = QPixmap()
-                pixmap.loadFromData(buffer.getvalue())
-                btn.img_label.setPixmap(pixmap)
-                btn.img_label.setStyleSheet("")
-            except Exception as e:
-                print(f"No se pudo cargar miniatura de {file_path}: {e}")
-                btn.img_label.setText("Error")
-                btn.img_label.setStyleSheet("color: red;")
-
-    def set_thumb_size(self, size):
-        self.thumb_size = size
-        for btn in self.image_buttons:
-            btn.setFixedSize(self.thumb_size + 20, self.thumb_size + (40 if not self.compact else 26))
-            btn.img_label.setMinimumSize(self.thumb_size, self.thumb_size)
-            btn.img_label.setMaximumSize(self.thumb_size, self.thumb_size)
-        self.images_container.setMinimumHeight(self.thumb_size + (40 if not self.compact else 26))
-        self.thumbnails_loaded = False
-        self.load_thumbnails()
-
-    def set_compact(self, compact):
-        self.compact = compact
-        self.images_layout.setSpacing(6 if self.compact else 10)
-        for btn in self.image_buttons:
-            btn.setFixedSize(self.thumb_size + 20, self.thumb_size + (40 if not self.compact else 26))
-        self.images_container.setMinimumHeight(self.thumb_size + (40 if not self.compact else 26))
-    
-    def toggle_selection(self, file_path, selected):
-        if selected:
-            self.selected_files.add(file_path)
-        else:
-            self.selected_files.discard(file_path)
-    
-    def select_all(self):
-        for btn in self.image_buttons:
-            if hasattr(btn, 'file_path'):
-                btn.setChecked(True)
-                self.selected_files.add(btn.file_path)
-    
-    def deselect_all(self):
-        for btn in self.image_buttons:
-            if hasattr(btn, 'file_path'):
-                btn.setChecked(False)
-                self.selected_files.discard(btn.file_path)
-    
-    def invert_selection(self):
-        for btn in self.image_buttons:
-            if hasattr(btn, 'file_path'):
-                if btn.isChecked():
-                    btn.setChecked(False)
-                    self.selected_files.discard(btn.file_path)
-                else:
-                    btn.setChecked(True)
-                    self.selected_files.add(btn.file_path)
+            name_rect = QRect(rect.x() + 5, thumb_rect.bottom() + 2,
+                              rect.width() - 10, rect.bottom() - thumb_rect.bottom() - 4)
+            painter.setFont(font)
+            painter.setPen(QColor("#ffffff"))
+            painter.drawText(name_rect, Qt.AlignCenter | Qt.TextWordWrap, filename)
+
+        # Separador entre grupos
+        painter.setPen(QColor("#dee2e6"))
+        painter.drawLine(option.rect.left(), option.rect.bottom(),
+                         option.rect.right(), option.rect.bottom())
+        painter.restore()
+
+    def file_at(self, row_rect, index, pos):
+        for column, (i, _) in enumerate(index.data(FILES_ROLE)):
+            if self.cell_rect(row_rect, column).contains(pos):
+                return i
+        return None
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            i = self.file_at(option.rect, index, event.pos())
+            if i is not None:
+                model.toggle(i)
+                return True
+        return False
 
 class PreviewDialog(QDialog):
     def __init__(self, image_paths, parent=None):
@@ -355,12 +594,7 @@ class PreviewDialog(QDialog):
         
         for path in image_paths:
             try:
-                img = Image.open(path)
-                img.thumbnail((400, 400))
-                buffer = io.BytesIO()
-                img.save(buffer, format="PNG")
-                pixmap = QPixmap()
-                pixmap.loadFromData(buffer.getvalue())
+                pixmap = thumbnail_cache.get(path, 400)
                 
                 label = QLabel()
                 label.setPixmap(pixmap)
@@ -388,6 +622,9 @@ class PreviewDialog(QDialog):
         layout.addWidget(close_btn)
 
 class DuplicateFinder(QWidget):
+    # Umbrales más permisivos que el de la búsqueda cuyos grupos se guardan
+    REGROUP_MARGIN = 3
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("ImageSnapPurge - Eliminar duplicados de imágenes")
@@ -540,44 +777,25 @@ class DuplicateFinder(QWidget):
         self.results_title.setProperty("class", "group-title")
         left_layout.addWidget(self.results_title)
         
-        # Contenedor para los grupos de duplicados con scroll
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-        self.scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-        
-        # Widget contenedor para los grupos
-        self.groups_container = QWidget()
-        self.groups_layout = QVBoxLayout(self.groups_container)
-        self.groups_layout.setSpacing(15)
-        self.groups_layout.setAlignment(Qt.AlignTop)
-        self.groups_layout.setContentsMargins(10, 10, 10, 10)
-        
-        self.scroll_area.setWidget(self.groups_container)
-        left_layout.addWidget(self.scroll_area)
-        
-        # Panel de paginación
-        self.pagination_panel = QWidget()
-        self.pagination_layout = QHBoxLayout(self.pagination_panel)
-        self.pagination_layout.setContentsMargins(0, 10, 0, 10)
-        
-        self.btn_prev_page = QPushButton("← Anterior")
-        self.btn_prev_page.clicked.connect(self.prev_page)
-        self.btn_prev_page.setEnabled(False)
-        self.pagination_layout.addWidget(self.btn_prev_page)
-        
-        self.page_label = QLabel("Página 1 de 1")
-        self.page_label.setAlignment(Qt.AlignCenter)
-        self.page_label.setStyleSheet("font-weight: 600; color: #495057;")
-        self.pagination_layout.addWidget(self.page_label, 1)
-        
-        self.btn_next_page = QPushButton("Siguiente →")
-        self.btn_next_page.clicked.connect(self.next_page)
-        self.btn_next_page.setEnabled(False)
-        self.pagination_layout.addWidget(self.btn_next_page)
-        
-        left_layout.addWidget(self.pagination_panel)
-        self.pagination_panel.hide()
+        # Vista de grupos con scroll continuo: solo se pintan las filas visibles
+        self.groups_model = DuplicateGroupsModel(self)
+        self.groups_delegate = GroupDelegate(self)
+        self.results_view = QListView()
+        self.results_view.setModel(self.groups_model)
+        self.results_view.setItemDelegate(self.groups_delegate)
+        self.results_view.setSelectionMode(QAbstractItemView.NoSelection)
+        self.results_view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.results_view.setHorizontalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.results_view.setLayoutMode(QListView.Batched)
+        self.results_view.setStyleSheet("QListView { background-color: #ffffff; border: none; }")
+        left_layout.addWidget(self.results_view)
+        
+        # Al desplazarse se cancelan las miniaturas de filas que ya no se ven
+        self.scroll_timer = QTimer(self)
+        self.scroll_timer.setSingleShot(True)
+        self.scroll_timer.setInterval(150)
+        self.scroll_timer.timeout.connect(self.on_scroll_settled)
+        self.results_view.verticalScrollBar().valueChanged.connect(self.scroll_timer.start)
         
         # Panel derecho - CONFIGURACIÓN
         right_panel = QWidget()
@@ -596,6 +814,23 @@ class DuplicateFinder(QWidget):
         self.btn_select.clicked.connect(self.select_folder)
         folder_layout.addWidget(self.btn_select)
         
+        # Índice de una biblioteca y consulta de un lote nuevo contra él
+        self.btn_index = QPushButton("📚 Indexar biblioteca")
+        self.btn_index.setMinimumWidth(180)
+        self.btn_index.clicked.connect(self.index_library)
+        folder_layout.addWidget(self.btn_index)
+        
+        self.btn_query = QPushButton("🔎 Buscar en biblioteca")
+        self.btn_query.setMinimumWidth(180)
+        self.btn_query.clicked.connect(self.query_library)
+        folder_layout.addWidget(self.btn_query)
+        
+        # Solo busca las imágenes de una carpeta (B) en otra (A), nunca dentro de cada una
+        self.btn_compare = QPushButton("⚖️ Comparar dos carpetas")
+        self.btn_compare.setMinimumWidth(180)
+        self.btn_compare.clicked.connect(self.compare_folders)
+        folder_layout.addWidget(self.btn_compare)
+        
         # Botón de cancelar búsqueda (inicialmente oculto)
         self.btn_cancel = QPushButton("❌ Cancelar búsqueda")
         self.btn_cancel.setObjectName("cancel_button")
@@ -618,6 +853,68 @@ class DuplicateFinder(QWidget):
         self.exclude_subfolders.setChecked(False)
         config_layout.addWidget(self.exclude_subfolders)
         
+        # Repetir la búsqueda solo sobre lo que cambió desde la anterior. Va
+        # desactivada: el manifiesto no relee las carpetas cuyo mtime no cambió,
+        # así que un archivo editado en su sitio conservaría el hash viejo
+        self.incremental_scan = QCheckBox("Búsqueda incremental")
+        self.incremental_scan.setChecked(False)
+        config_layout.addWidget(self.incremental_scan)
+        
+        # Actualizar los grupos cuando cambian archivos en la carpeta
+        self.watch_folder = QCheckBox("Vigilar carpeta")
+        self.watch_folder.setChecked(False)
+        self.watch_folder.stateChanged.connect(self.on_watch_changed)
+        config_layout.addWidget(self.watch_folder)
+        
+        # Motor de agrupación de hashes similares
+        grouping_row = QHBoxLayout()
+        grouping_row.setContentsMargins(0, 0, 0, 0)
+        grouping_row.addWidget(QLabel("Motor de agrupación:"))
+        self.grouping_combo = QComboBox()
+        self.grouping_combo.addItem("Bandas de bits", "bands")
+        self.grouping_combo.addItem("NumPy por bloques", "numpy")
+        grouping_row.addWidget(self.grouping_combo)
+        config_layout.addLayout(grouping_row)
+        
+        # Hash que propone candidatos y verificación opcional en cascada
+        hash_row = QHBoxLayout()
+        hash_row.setContentsMargins(0, 0, 0, 0)
+        hash_row.addWidget(QLabel("Hash:"))
+        self.algorithm_combo = QComboBox()
+        for name in HASH_ALGORITHMS:
+            self.algorithm_combo.addItem(name, name)
+        hash_row.addWidget(self.algorithm_combo)
+        hash_row.addWidget(QLabel("Verificar con:"))
+        self.verify_combo = QComboBox()
+        self.verify_combo.addItem("Nada", None)
+        for name in VERIFY_METHODS:
+            self.verify_combo.addItem("Píxeles" if name == "pixels" else name, name)
+        hash_row.addWidget(self.verify_combo)
+        config_layout.addLayout(hash_row)
+        
+        # Copias giradas o en espejo
+        dihedral_row = QHBoxLayout()
+        dihedral_row.setContentsMargins(0, 0, 0, 0)
+        dihedral_row.addWidget(QLabel("Giros y espejos:"))
+        self.dihedral_combo = QComboBox()
+        self.dihedral_combo.addItem("No detectar", None)
+        self.dihedral_combo.addItem("Orientación canónica", "canonical")
+        self.dihedral_combo.addItem("Probar las 8 orientaciones", "probe")
+        dihedral_row.addWidget(self.dihedral_combo)
+        config_layout.addLayout(dihedral_row)
+        
+        # Lecturas en vuelo: en unidades de red ocultan la latencia
+        prefetch_row = QHBoxLayout()
+        prefetch_row.setContentsMargins(0, 0, 0, 0)
+        prefetch_row.addWidget(QLabel("Lectura anticipada:"))
+        self.prefetch_combo = QComboBox()
+        self.prefetch_combo.addItem("Desactivada", 0)
+        self.prefetch_combo.addItem("8 lecturas", 8)
+        self.prefetch_combo.addItem("32 lecturas (red)", 32)
+        self.prefetch_combo.addItem("128 lecturas (red lenta)", 128)
+        prefetch_row.addWidget(self.prefetch_combo)
+        config_layout.addLayout(prefetch_row)
+        
         # Modo compacto y tamaño de miniatura
         compact_row = QHBoxLayout()
         compact_row.setContentsMargins(0, 0, 0, 0)
@@ -646,6 +943,7 @@ class DuplicateFinder(QWidget):
         self.slider.setTickPosition(QSlider.TicksBelow)
         self.slider.setTickInterval(5)
         self.slider.valueChanged.connect(self.update_rigidez_label)
+        self.slider.valueChanged.connect(self.on_threshold_changed)
         config_layout.addWidget(self.slider)
         
         # Etiquetas de niveles con mejor alineación
@@ -706,6 +1004,20 @@ class DuplicateFinder(QWidget):
         self.progress_label.setProperty("class", "progress-label")
         info_layout.addWidget(self.progress_label)
         
+        # Rendimiento de la búsqueda en curso y perfil de la última
+        self.throughput_label = QLabel("")
+        self.throughput_label.setAlignment(Qt.AlignCenter)
+        self.throughput_label.setStyleSheet("color: #6c757d;")
+        self.throughput_label.hide()
+        info_layout.addWidget(self.throughput_label)
+        
+        self.btn_save_profile = QPushButton("💾 Guardar perfil")
+        self.btn_save_profile.setToolTip("Guarda en JSON las métricas de la última búsqueda")
+        self.btn_save_profile.clicked.connect(self.save_profile)
+        self.btn_save_profile.hide()
+        info_layout.addWidget(self.btn_save_profile)
+        self.last_profile = None
+        
         info_group.setLayout(info_layout)
         right_layout.addWidget(info_group)
         
@@ -751,12 +1063,25 @@ class DuplicateFinder(QWidget):
         self.btn_autoselect_best = QPushButton("⭐ Mantener mejor")
         self.btn_autoselect_best.clicked.connect(self.autoselect_keep_best)
 
+        # Criterio con el que "Mantener mejor" elige la imagen que se conserva
+        self.keep_policy_combo = QComboBox()
+        self.keep_policy_combo.addItem("Mayor resolución", "resolution")
+        self.keep_policy_combo.addItem("Mejor formato", "format")
+        self.keep_policy_combo.addItem("Más antigua", "oldest")
+        self.keep_policy_combo.addItem("Ruta que coincide…", "path")
+        self.keep_policy_combo.addItem("Conservar referencia (A)", "reference")
+        self.keep_pattern = ""
+
         self.btn_delete = QPushButton("🗑️ Eliminar")
         self.btn_delete.clicked.connect(self.delete_selected)
 
         self.btn_move = QPushButton("📂 Mover")
         self.btn_move.clicked.connect(self.move_selected)
 
+        self.btn_link = QPushButton("🔗 Enlazar")
+        self.btn_link.setToolTip("Sustituye los seleccionados idénticos por enlaces a la imagen que se conserva")
+        self.btn_link.clicked.connect(self.link_selected)
+
         self.bottom_bar = bottom_bar
         self.bottom_layout = bottom_layout
         self.bottom_buttons = [
@@ -764,8 +1089,10 @@ class DuplicateFinder(QWidget):
             self.btn_deselect_all,
             self.btn_invert_selection,
             self.btn_autoselect_best,
+            self.keep_policy_combo,
             self.btn_delete,
             self.btn_move,
+            self.btn_link,
         ]
 
         # Colocar inicialmente (se reacomoda en resizeEvent)
@@ -775,15 +1102,34 @@ class DuplicateFinder(QWidget):
         # Aplicar estilo de negrita y tamaño mayor a los títulos de los QGroupBox
         self.applyGroupBoxTitleStyle()
         
-        self.images = {}
         self.thread = None
         self.worker = None
-        self.group_widgets = []
         
-        # Variables para paginación
-        self.current_page = 1
-        self.groups_per_page = 6  # más compacto por página
-        self.total_pages = 1
+        # Estado de la última búsqueda, para las búsquedas incrementales
+        self.scan_folder = None
+        self.scan_state = None
+        self.scan_options = None
+        self.auto_scan = False
+        self.pending_selection = set()
+        
+        # Fuera del rango de umbrales que guardó la búsqueda, reagrupar en
+        # segundo plano cuando el slider se detenga
+        self.regroup_timer = QTimer(self)
+        self.regroup_timer.setSingleShot(True)
+        self.regroup_timer.setInterval(300)
+        self.regroup_timer.timeout.connect(self.start_regroup)
+        
+        # Vigilancia de la carpeta (inotify en Linux); los cambios se agrupan
+        # durante unos segundos antes de lanzar la búsqueda incremental
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.on_directory_changed)
+        self.watch_timer = QTimer(self)
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.setInterval(2000)
+        self.watch_timer.timeout.connect(self.rescan_watched_folder)
+        
+        self.groups_delegate.thumb_size = self.get_current_thumb_size()
+        self.groups_delegate.compact = self.compact_mode.isChecked()
         
         # Forzar la actualización inicial del slider
         self.update_rigidez_label(self.slider.value())
@@ -824,9 +1170,6 @@ class DuplicateFinder(QWidget):
         # Reacomodar botones según ancho disponible
         if hasattr(self, 'bottom_layout'):
             self.arrange_bottom_bar()
-        # Reacomodar grupos si hay resultados
-        if hasattr(self, 'group_widgets') and self.group_widgets:
-            self.show_page(self.current_page)
 
     def applyGroupBoxTitleStyle(self):
         # Buscar todos los QGroupBox en la interfaz
@@ -881,36 +1224,260 @@ class DuplicateFinder(QWidget):
             
         folder = QFileDialog.getExistingDirectory(self, "Selecciona carpeta de imágenes")
         if folder:
-            self.clear_groups()
-            self.btn_select.setEnabled(False)
-            self.btn_cancel.show()  # Mostrar botón de cancelar
-            self.slider.setEnabled(False)  # Deshabilitar slider
-            self.exclude_subfolders.setEnabled(False)  # Deshabilitar checkbox
-            self.progress_label.setText("Progreso: 0%")
-            self.info_label.setText("Buscando duplicados...")
-            
-            self.thread = QThread()
-            # Invertimos el valor para el Worker (más alto = más permisivo)
-            self.worker = Worker(folder, 20 - self.slider.value(), self.exclude_subfolders.isChecked())
-            self.worker.moveToThread(self.thread)
-            
-            self.thread.started.connect(self.worker.run)
-            self.worker.finished.connect(self.on_finished)
-            self.worker.progress.connect(self.update_progress)
-            self.worker.error.connect(self.on_error)
-            self.worker.cancelled.connect(self.on_cancelled)  # Conectar señal de cancelación
-            
-            self.worker.finished.connect(self.thread.quit)
-            self.worker.finished.connect(self.worker.deleteLater)
-            self.thread.finished.connect(self.thread.deleteLater)
-            self.thread.finished.connect(self.on_thread_finished)
-            
-            self.thread.start()
+            self.start_scan(folder)
+
+    def start_scan(self, folder, auto=False, regroup=False):
+        # Las búsquedas automáticas conservan la selección actual
+        self.auto_scan = auto or regroup
+        self.pending_selection = set(self.get_selected_files()) if self.auto_scan else set()
+        previous = None
+        # Las búsquedas de la vigilancia siempre parten de la anterior: la
+        # casilla solo decide si se salta el listado de carpetas sin cambios
+        if auto or regroup or (self.incremental_scan.isChecked() and folder == self.scan_folder):
+            previous = self.scan_state
+        self.scan_folder = folder
+        threshold = 20 - self.slider.value()
+        if regroup:
+            # El slider solo cambia el umbral: mismas opciones que la búsqueda que se reagrupa
+            options = dict(self.scan_options)
+        else:
+            options = dict(exclude_subfolders=self.exclude_subfolders.isChecked(),
+                           grouping=self.grouping_combo.currentData(),
+                           algorithm=self.algorithm_combo.currentData(),
+                           verify=self.verify_combo.currentData(),
+                           dihedral=self.dihedral_combo.currentData(),
+                           prefetch=self.prefetch_combo.currentData())
+        self.scan_options = options
+        
+        self.clear_groups()
+        self.disable_search_controls()
+        self.throughput_label.show()
+        self.info_label.setText("Actualizando grupos..." if self.auto_scan else "Buscando duplicados...")
+        
+        self.thread = QThread()
+        # Invertimos el valor para el Worker (más alto = más permisivo). Se
+        # guardan los grupos de algunos umbrales más, para mover el slider sin esperar
+        self.worker = Worker(folder, threshold, regroup=regroup,
+                             max_threshold=min(20, threshold + self.REGROUP_MARGIN),
+                             incremental=self.incremental_scan.isChecked(), previous=previous,
+                             **options)
+        self.worker.moveToThread(self.thread)
+        
+        self.thread.started.connect(self.worker.run)
+        self.worker.finished.connect(self.on_finished)
+        self.worker.progress.connect(self.update_progress)
+        self.worker.stats.connect(self.update_throughput)
+        self.worker.error.connect(self.on_error)
+        self.worker.cancelled.connect(self.on_cancelled)  # Conectar señal de cancelación
+        
+        self.worker.finished.connect(self.thread.quit)
+        self.worker.finished.connect(self.worker.deleteLater)
+        self.thread.finished.connect(self.thread.deleteLater)
+        self.thread.finished.connect(self.on_thread_finished)
+        
+        self.thread.start()
+
+    def disable_search_controls(self):
+        self.btn_select.setEnabled(False)
+        self.btn_index.setEnabled(False)
+        self.btn_query.setEnabled(False)
+        self.btn_compare.setEnabled(False)
+        self.btn_cancel.show()  # Mostrar botón de cancelar
+        self.slider.setEnabled(False)  # Deshabilitar slider
+        self.exclude_subfolders.setEnabled(False)  # Deshabilitar checkbox
+        self.grouping_combo.setEnabled(False)
+        self.algorithm_combo.setEnabled(False)
+        self.verify_combo.setEnabled(False)
+        self.dihedral_combo.setEnabled(False)
+        self.prefetch_combo.setEnabled(False)
+        self.incremental_scan.setEnabled(False)
+        self.progress_label.setText("Progreso: 0%")
+        self.throughput_label.setText("")
+        self.throughput_label.setToolTip("")
+        self.btn_save_profile.hide()
+
+    def index_library(self):
+        if self.thread and self.thread.isRunning():
+            QMessageBox.information(self, "Proceso en curso", 
+                                   "Ya hay un proceso en ejecución. Espere a que termine.")
+            return
+        folder = QFileDialog.getExistingDirectory(self, "Selecciona la biblioteca a indexar")
+        if not folder:
+            return
+        # El índice usa el hash elegido; los giros se prueban al consultar
+        self.start_task("Indexando biblioteca...", IndexBuilder, folder,
+                        algorithm=self.algorithm_combo.currentData(),
+                        exclude_subfolders=self.exclude_subfolders.isChecked(),
+                        prefetch=self.prefetch_combo.currentData())
+
+    def query_library(self):
+        if self.thread and self.thread.isRunning():
+            QMessageBox.information(self, "Proceso en curso", 
+                                   "Ya hay un proceso en ejecución. Espere a que termine.")
+            return
+        library = QFileDialog.getExistingDirectory(self, "Selecciona la biblioteca indexada")
+        if not library:
+            return
+        try:
+            index = LibraryIndex(resolve_index_path(library))
+        except FileNotFoundError:
+            QMessageBox.information(self, "Biblioteca sin índice",
+                                    "Esta carpeta no está indexada. Indéxala primero con "
+                                    "\"Indexar biblioteca\".")
+            return
+        except ValueError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        batch = QFileDialog.getExistingDirectory(self, "Selecciona las imágenes nuevas")
+        if not batch:
+            return
+        self.start_task("Buscando en la biblioteca...", LibraryQuery, index, batch,
+                        threshold=20 - self.slider.value(),
+                        rotations=self.dihedral_combo.currentData() is not None,
+                        exclude_subfolders=self.exclude_subfolders.isChecked(),
+                        prefetch=self.prefetch_combo.currentData())
+
+    def compare_folders(self):
+        if self.thread and self.thread.isRunning():
+            QMessageBox.information(self, "Proceso en curso", 
+                                   "Ya hay un proceso en ejecución. Espere a que termine.")
+            return
+        reference = QFileDialog.getExistingDirectory(self, "Selecciona la carpeta de referencia (A)")
+        if not reference:
+            return
+        candidate = QFileDialog.getExistingDirectory(self, "Selecciona la carpeta que se busca en A (B)")
+        if not candidate:
+            return
+        self.start_task("Comparando carpetas...", SetComparison,
+                        [(reference, "reference"), (candidate, "candidate")],
+                        20 - self.slider.value(),
+                        exclude_subfolders=self.exclude_subfolders.isChecked(),
+                        grouping=self.grouping_combo.currentData(),
+                        algorithm=self.algorithm_combo.currentData(),
+                        verify=self.verify_combo.currentData(),
+                        dihedral=self.dihedral_combo.currentData(),
+                        prefetch=self.prefetch_combo.currentData())
+
+    def start_task(self, message, task_class, *args, **options):
+        # Biblioteca y comparación de carpetas no son una búsqueda: no se reagrupan ni se vigilan
+        self.regroup_timer.stop()
+        self.scan_state = None
+        self.scan_folder = None
+        self.update_watched_dirs()
+        self.clear_groups()
+        self.disable_search_controls()
+        self.throughput_label.hide()
+        self.info_label.setText(message)
+        
+        self.thread = QThread()
+        self.worker = TaskWorker(task_class, *args, **options)
+        self.worker.moveToThread(self.thread)
+        
+        self.thread.started.connect(self.worker.run)
+        self.worker.finished.connect(self.on_task_finished)
+        self.worker.progress.connect(self.update_progress)
+        self.worker.error.connect(self.on_error)
+        self.worker.cancelled.connect(self.on_cancelled)
+        
+        self.worker.finished.connect(self.thread.quit)
+        self.worker.finished.connect(self.worker.deleteLater)
+        self.thread.finished.connect(self.thread.deleteLater)
+        self.thread.finished.connect(self.on_thread_finished)
+        
+        self.thread.start()
+
+    def on_task_finished(self, result):
+        self.reset_ui_after_search()
+        if result is None:
+            return
+        self.progress_label.setText("Completado")
+        self.progress_label.setStyleSheet("background-color: #4caf50; color: white; padding: 8px 12px; border-radius: 6px; font-weight: 600;")
+        task = self.worker.task
+        if isinstance(task, IndexBuilder):
+            self.info_label.setText(f"Biblioteca indexada: {len(result)} imágenes")
+            return
+        if isinstance(task, SetComparison):
+            # Un grupo por imagen compartida: primero las de A y después las de B
+            results = task.results()
+            self.groups_model.set_store(results)
+            self.results_view.scrollToTop()
+            self.update_stats(len(results), results.file_count, results.file_count - len(results))
+            found = int((results.roles == ROLES.index("candidate")).sum())
+            info = f"{found} imágenes de B ya están en A ({len(results)} grupos)"
+            if task.verify:
+                info += f" ({task.confirmed_pairs} de {task.candidate_pairs} pares confirmados)"
+            self.info_label.setText(info)
+            return
+        # Un grupo por imagen nueva que ya está en la biblioteca: ella primero
+        results = task.results()
+        self.groups_model.set_store(results)
+        self.results_view.scrollToTop()
+        self.update_stats(len(results), results.file_count, len(results))
+        self.info_label.setText(f"{len(result)} de {task.queried} imágenes nuevas ya están en la "
+                                f"biblioteca ({task.search_time * 1000:.0f} ms en el índice)")
+
+    def on_threshold_changed(self, value):
+        if self.scan_state is None or (self.thread and self.thread.isRunning()):
+            return
+        threshold = 20 - value
+        if self.scan_state.can_regroup(threshold):
+            self.regroup_timer.stop()
+            self.apply_threshold(threshold)
+        else:
+            self.regroup_timer.start()
+
+    def apply_threshold(self, threshold):
+        # Los grupos de este umbral ya están calculados: solo se reparten de nuevo
+        selected = set(self.get_selected_files())
+        self.scan_state.regroup(threshold)
+        results = self.scan_state.results()
+        results.select_paths(selected)
+        self.groups_model.set_store(results)
+        total_groups = len(results)
+        total_images = results.file_count
+        self.info_label.setText(f"Umbral {threshold}: {total_groups} grupos, "
+                                f"{total_images - total_groups} duplicados")
+        self.update_stats(total_groups, total_images, total_images - total_groups)
+
+    def start_regroup(self):
+        if self.scan_state is None or (self.thread and self.thread.isRunning()):
+            return
+        self.start_scan(self.scan_folder, regroup=True)
+
+    def on_watch_changed(self, state):
+        self.update_watched_dirs()
+
+    def update_watched_dirs(self):
+        watched = self.watcher.directories()
+        if watched:
+            self.watcher.removePaths(watched)
+        if self.watch_folder.isChecked() and self.scan_state is not None:
+            dirs = [path for path, (_, mtime_ns) in self.scan_state.dirs.items()
+                    if mtime_ns is not None]
+            if dirs:
+                self.watcher.addPaths(dirs)
+
+    def on_directory_changed(self, path):
+        self.watch_timer.start()
+
+    def rescan_watched_folder(self):
+        if not self.watch_folder.isChecked() or self.scan_folder is None:
+            return
+        if self.thread and self.thread.isRunning():
+            # Reintentar cuando termine la búsqueda en curso
+            self.watch_timer.start()
+            return
+        self.start_scan(self.scan_folder, auto=True)
 
     def cancel_search(self):
         if self.worker:
             self.worker.stop()
-            self.info_label.setText("Cancelando búsqueda...")
+            if isinstance(self.worker, OperationWorker):
+                self.info_label.setText("Cancelando operación...")
+            elif isinstance(self.worker, TaskWorker):
+                self.info_label.setText("Cancelando...")
+            else:
+                self.info_label.setText("Cancelando búsqueda...")
             self.btn_cancel.setEnabled(False)
 
     def on_cancelled(self):
@@ -919,11 +1486,7 @@ class DuplicateFinder(QWidget):
         self.reset_ui_after_search()
 
     def clear_groups(self):
-        for i in reversed(range(self.groups_layout.count())): 
-            self.groups_layout.itemAt(i).widget().setParent(None)
-        self.group_widgets = []
-        self.current_page = 1
-        self.pagination_panel.hide()
+        self.groups_model.clear()
         self.stats_label.setText("No hay resultados")
 
     def update_progress(self, value):
@@ -937,43 +1500,90 @@ class DuplicateFinder(QWidget):
             
         self.progress_label.setStyleSheet(f"background-color: {color}; color: white; padding: 8px 12px; border-radius: 6px; font-weight: 600;")
 
+    def update_throughput(self, stats):
+        text = f"{stats['files_per_second']:.0f} archivos/s · {stats['mb_per_second']:.1f} MB/s"
+        if "queue_depth" in stats:
+            text += f" · {stats['queue_depth']} lecturas en cola, {stats['mb_in_flight']:.0f} MB en vuelo"
+        if stats["errors"]:
+            text += f" · {stats['errors']} errores"
+        self.throughput_label.setText(text)
+
+    def show_profile(self, profile):
+        # Resumen final; el detalle va en el tooltip y en "Guardar perfil"
+        data = profile.to_dict()
+        self.update_throughput(data)
+        names = {"listing": "Recorrido", "hashing": "Hash", "cache": "Caché", "grouping": "Agrupación"}
+        lines = [f"{names.get(phase, phase)}: {seconds:.2f} s" for phase, seconds in data["phases"].items()]
+        for ext, stats in data["formats"].items():
+            lines.append(f"{ext}: {stats['files']} archivos, decodificar {stats['decode_seconds']:.2f} s, "
+                         f"hash {stats['hash_seconds']:.2f} s")
+        for kind, count in data["errors_by_type"].items():
+            lines.append(f"{kind}: {count}")
+        if "prefetch" in data:
+            prefetch = data["prefetch"]
+            lines.append(f"Lectura anticipada: {prefetch['depth']} en vuelo, máximo "
+                         f"{prefetch['max_mb_in_flight']:.0f} MB, leer {prefetch['read_seconds']:.2f} s")
+        rate = data["grouping"]["comparisons_per_second"]
+        if rate:
+            lines.append(f"Agrupación: {rate:,.0f} comparaciones/s")
+        if data["slowest"]:
+            lines.append("Más lento: " + os.path.basename(data["slowest"][0]["path"]) +
+                         f" ({data['slowest'][0]['seconds']:.2f} s)")
+        self.throughput_label.setToolTip("\n".join(lines))
+        self.last_profile = profile
+        self.btn_save_profile.show()
+
+    def save_profile(self):
+        if self.last_profile is None:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Guardar perfil", "perfil.json", "JSON (*.json)")
+        if not path:
+            return
+        try:
+            self.last_profile.dump(path)
+        except OSError as e:
+            QMessageBox.warning(self, "Error", f"No se pudo guardar el perfil: {e}")
+
     def on_error(self, message):
         QMessageBox.critical(self, "Error", message)
         self.reset_ui_after_search()
         self.info_label.setText("Error en la búsqueda")
         self.progress_label.setStyleSheet("background-color: #e9ecef; color: #495057; padding: 8px 12px; border-radius: 6px; font-weight: 600;")
 
-    def on_finished(self, duplicates):
-        self.images = duplicates
+    def on_finished(self, results):
+        if self.worker is not None:
+            # Si se canceló una reagrupación se conserva la búsqueda anterior
+            if self.worker.scanner.state is not None or not self.worker.regroup:
+                self.scan_state = self.worker.scanner.state
+            self.update_watched_dirs()
+            if self.scan_state is not None:
+                self.show_profile(self.worker.scanner.profile)
         self.progress_label.setText("Búsqueda completada")
         self.progress_label.setStyleSheet("background-color: #4caf50; color: white; padding: 8px 12px; border-radius: 6px; font-weight: 600;")
         
-        if not duplicates:
+        if not len(results):
             # Mostrar mensaje de no se encontraron duplicados
             self.info_label.setText("No se encontraron imágenes duplicadas")
             self.reset_ui_after_search()
-            QMessageBox.information(self, "Resultado", "No se encontraron imágenes duplicadas.")
+            if not self.auto_scan:
+                QMessageBox.information(self, "Resultado", "No se encontraron imágenes duplicadas.")
             return
         
-        total_groups = len(duplicates)
-        total_images = sum(len(files) for files in duplicates.values())
+        total_groups = len(results)
+        total_images = results.file_count
         total_duplicates = total_images - total_groups
         
-        self.info_label.setText(f"Búsqueda completada: {total_groups} grupos, {total_duplicates} duplicados")
-        
-        current_thumb = self.get_current_thumb_size()
-        is_compact = self.compact_mode.isChecked()
-        for files in duplicates.values():
-            group_widget = ImageGroupWidget(files, thumb_size=current_thumb, compact=is_compact)
-            self.group_widgets.append(group_widget)
-        
-        self.total_pages = max(1, (len(self.group_widgets) + self.groups_per_page - 1) // self.groups_per_page)
-        self.current_page = 1
+        scanner = self.worker.scanner if self.worker is not None else None
+        done = "Reagrupación completada" if scanner is not None and self.worker.regroup else "Búsqueda completada"
+        info = f"{done}: {total_groups} grupos, {total_duplicates} duplicados"
+        if scanner is not None and scanner.verify:
+            info += f" ({scanner.confirmed_pairs} de {scanner.candidate_pairs} pares confirmados)"
+        self.info_label.setText(info)
         
-        self.show_page(1)
-        
-        if self.total_pages > 1:
-            self.pagination_panel.show()
+        results.select_paths(self.pending_selection)
+        self.pending_selection = set()
+        self.groups_model.set_store(results)
+        self.results_view.scrollToTop()
         
         self.update_stats(total_groups, total_images, total_duplicates)
         self.reset_ui_after_search()
@@ -983,22 +1593,34 @@ class DuplicateFinder(QWidget):
         return 80 if idx == 0 else (110 if idx == 1 else 140)
 
     def on_compact_changed(self, state):
-        is_compact = self.compact_mode.isChecked()
-        for gw in self.group_widgets:
-            gw.set_compact(is_compact)
+        self.groups_delegate.compact = self.compact_mode.isChecked()
+        self.results_view.doItemsLayout()
 
     def on_thumb_size_changed(self, index):
-        size = self.get_current_thumb_size()
-        for gw in self.group_widgets:
-            gw.set_thumb_size(size)
+        self.groups_delegate.thumb_size = self.get_current_thumb_size()
+        self.groups_model.cancel_thumbnails()
+        self.results_view.doItemsLayout()
+
+    def on_scroll_settled(self):
+        self.groups_model.cancel_thumbnails()
+        self.results_view.viewport().update()
 
     def reset_ui_after_search(self):
         # Restaurar el estado de la interfaz después de la búsqueda
         self.btn_select.setEnabled(True)
+        self.btn_index.setEnabled(True)
+        self.btn_query.setEnabled(True)
+        self.btn_compare.setEnabled(True)
         self.btn_cancel.hide()
         self.btn_cancel.setEnabled(True)  # Rehabilitar el botón para la próxima búsqueda
         self.slider.setEnabled(True)
         self.exclude_subfolders.setEnabled(True)
+        self.grouping_combo.setEnabled(True)
+        self.algorithm_combo.setEnabled(True)
+        self.verify_combo.setEnabled(True)
+        self.dihedral_combo.setEnabled(True)
+        self.prefetch_combo.setEnabled(True)
+        self.incremental_scan.setEnabled(True)
 
     def update_stats(self, groups, images, duplicates):
         self.stats_label.setText(
@@ -1011,55 +1633,17 @@ class DuplicateFinder(QWidget):
         self.thread = None
         self.worker = None
 
-    def show_page(self, page_num):
-        # Limpiar layout
-        for i in reversed(range(self.groups_layout.count())): 
-            self.groups_layout.itemAt(i).widget().setParent(None)
-        
-        start_idx = (page_num - 1) * self.groups_per_page
-        end_idx = min(start_idx + self.groups_per_page, len(self.group_widgets))
-        
-        for i in range(start_idx, end_idx):
-            group_widget = self.group_widgets[i]
-            self.groups_layout.addWidget(group_widget)
-            
-            if i < end_idx - 1:
-                separator = QFrame()
-                separator.setFrameShape(QFrame.HLine)
-                separator.setFrameShadow(QFrame.Sunken)
-                separator.setStyleSheet("background-color: #dee2e6;")
-                self.groups_layout.addWidget(separator)
-        
-        self.page_label.setText(f"Página {page_num} de {self.total_pages}")
-        self.btn_prev_page.setEnabled(page_num > 1)
-        self.btn_next_page.setEnabled(page_num < self.total_pages)
-        self.current_page = page_num
-
-    def prev_page(self):
-        if self.current_page > 1:
-            self.show_page(self.current_page - 1)
-
-    def next_page(self):
-        if self.current_page < self.total_pages:
-            self.show_page(self.current_page + 1)
-
     def get_selected_files(self):
-        selected_files = []
-        for group_widget in self.group_widgets:
-            selected_files.extend(group_widget.selected_files)
-        return selected_files
+        return self.groups_model.store.selected_paths()
 
     def select_all_images(self):
-        for group_widget in self.group_widgets:
-            group_widget.select_all()
+        self.groups_model.select_all()
 
     def deselect_all_images(self):
-        for group_widget in self.group_widgets:
-            group_widget.deselect_all()
+        self.groups_model.deselect_all()
 
     def invert_selection(self):
-        for group_widget in self.group_widgets:
-            group_widget.invert_selection()
+        self.groups_model.invert_selection()
 
     def delete_selected(self):
         selected_files = self.get_selected_files()
@@ -1072,77 +1656,96 @@ class DuplicateFinder(QWidget):
                                     QMessageBox.Yes | QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            deleted = 0
-            for file_path in selected_files:
-                try:
-                    send2trash(file_path)
-                    deleted += 1
-                except Exception as e:
-                    QMessageBox.warning(self, "Error", f"No se pudo borrar {file_path}:\n{e}")
-            
-            self.refresh_groups()
-            QMessageBox.information(self, "Listo", f"Se eliminaron {deleted} archivos.")
+            self.start_operation(selected_files, "trash")
+
+    def start_operation(self, paths, action, destination=None, keep=None):
+        if self.thread and self.thread.isRunning():
+            QMessageBox.information(self, "Proceso en curso", 
+                                   "Ya hay un proceso en ejecución. Espere a que termine.")
+            return
+        
+        self.btn_select.setEnabled(False)
+        self.btn_index.setEnabled(False)
+        self.btn_query.setEnabled(False)
+        self.btn_compare.setEnabled(False)
+        for btn in self.bottom_buttons:
+            btn.setEnabled(False)
+        self.btn_cancel.setText("❌ Cancelar operación")
+        self.btn_cancel.show()
+        self.progress_label.setText("Progreso: 0%")
+        self.info_label.setText({"trash": "Enviando a la papelera...",
+                                 "move": "Moviendo archivos...",
+                                 "link": "Enlazando duplicados..."}[action])
+        
+        self.thread = QThread()
+        self.worker = OperationWorker(paths, action, destination, keep)
+        self.worker.moveToThread(self.thread)
+        
+        self.thread.started.connect(self.worker.run)
+        self.worker.finished.connect(self.on_operation_finished)
+        self.worker.progress.connect(self.update_progress)
+        
+        self.worker.finished.connect(self.thread.quit)
+        self.worker.finished.connect(self.worker.deleteLater)
+        self.thread.finished.connect(self.thread.deleteLater)
+        self.thread.finished.connect(self.on_thread_finished)
+        
+        self.thread.start()
+
+    def on_operation_finished(self, report):
+        action = self.worker.operation.action if self.worker is not None else "trash"
+        if self.scan_state is not None:
+            # Para que al mover el slider no vuelvan los archivos procesados
+            # ni sigan unidos los grupos que solo enlazaba alguno de ellos
+            Scanner(self.scan_folder, 20 - self.slider.value(),
+                    **self.scan_options).discard(self.scan_state, report.done)
+        self.refresh_groups(removed=set(report.done))
+        
+        self.btn_select.setEnabled(True)
+        self.btn_index.setEnabled(True)
+        self.btn_query.setEnabled(True)
+        self.btn_compare.setEnabled(True)
+        for btn in self.bottom_buttons:
+            btn.setEnabled(True)
+        self.btn_cancel.hide()
+        self.btn_cancel.setEnabled(True)
+        self.btn_cancel.setText("❌ Cancelar búsqueda")
+        self.progress_label.setText("Operación completada")
+        
+        verb = {"trash": "eliminaron", "move": "movieron", "link": "enlazaron"}[action]
+        message = f"Se {verb} {len(report.done)} archivos."
+        if action == "link":
+            message += f" Espacio recuperado: {report.bytes_reclaimed / (1024 * 1024):.1f} MB."
+        if report.cancelled:
+            message += " La operación se canceló."
+        self.info_label.setText(message)
+        if report.errors:
+            # Un solo aviso con todos los errores, en vez de uno por archivo
+            box = QMessageBox(QMessageBox.Warning, "Errores",
+                              f"{message}\nNo se pudieron procesar {len(report.errors)} archivos:\n\n"
+                              f"{report.error_summary()}", parent=self)
+            box.setDetailedText("\n".join(f"{path}: {error}" for path, error in report.errors))
+            box.exec_()
+        else:
+            QMessageBox.information(self, "Listo", message)
 
     def autoselect_keep_best(self):
         """Selecciona automáticamente todos los duplicados de cada grupo
-        manteniendo sin seleccionar la imagen de mejor resolución.
-        Criterio: mayor área (ancho*alto); en empate, mayor tamaño en bytes; luego más reciente por mtime.
+        manteniendo sin seleccionar la mejor imagen según el criterio elegido.
+        Usa el tamaño, la fecha y las dimensiones guardados durante la búsqueda,
+        sin volver a abrir los archivos.
         """
-        groups_processed = 0
-        for group_widget in self.group_widgets:
-            files = list(group_widget.files)
-            if len(files) < 2:
-                continue
+        policy = self.keep_policy_combo.currentData()
+        pattern = None
+        if policy == "path":
+            pattern, ok = QInputDialog.getText(
+                self, "Mantener mejor", "Conservar la imagen cuya ruta coincida con "
+                "(por ejemplo */Originales/*):", text=self.keep_pattern)
+            if not ok or not pattern.strip():
+                return
+            pattern = self.keep_pattern = pattern.strip()
 
-            best_file = None
-            best_area = -1
-            best_size = -1
-            best_mtime = -1
-
-            # Calcular métricas por archivo
-            for path in files:
-                width = height = 0
-                try:
-                    with Image.open(path) as img:
-                        width, height = img.size
-                except Exception:
-                    pass
-                area = width * height
-                try:
-                    size_bytes = os.path.getsize(path)
-                except Exception:
-                    size_bytes = -1
-                try:
-                    mtime = os.path.getmtime(path)
-                except Exception:
-                    mtime = -1
-
-                candidate_better = False
-                if area > best_area:
-                    candidate_better = True
-                elif area == best_area and size_bytes > best_size:
-                    candidate_better = True
-                elif area == best_area and size_bytes == best_size and mtime > best_mtime:
-                    candidate_better = True
-
-                if candidate_better:
-                    best_file = path
-                    best_area = area
-                    best_size = size_bytes
-                    best_mtime = mtime
-
-            # Aplicar selección: marcar todos excepto el mejor
-            if best_file:
-                group_widget.deselect_all()
-                for btn in group_widget.image_buttons:
-                    if hasattr(btn, 'file_path'):
-                        if btn.file_path != best_file:
-                            btn.setChecked(True)
-                            group_widget.selected_files.add(btn.file_path)
-                        else:
-                            btn.setChecked(False)
-                            group_widget.selected_files.discard(btn.file_path)
-                groups_processed += 1
+        groups_processed = self.groups_model.keep_best(policy, pattern)
 
         QMessageBox.information(self, "Auto-selección", f"Se aplicó la auto-selección en {groups_processed} grupos.")
 
@@ -1156,69 +1759,51 @@ class DuplicateFinder(QWidget):
         if not folder:
             return
             
-        moved = 0
-        for file_path in selected_files:
-            try:
-                filename = os.path.basename(file_path)
-                new_path = os.path.join(folder, filename)
-                
-                if os.path.exists(new_path):
-                    base, ext = os.path.splitext(filename)
-                    i = 1
-                    while os.path.exists(os.path.join(folder, f"{base}_{i}{ext}")):
-                        i += 1
-                    new_path = os.path.join(folder, f"{base}_{i}{ext}")
-                
-                os.rename(file_path, new_path)
-                moved += 1
-            except Exception as e:
-                QMessageBox.warning(self, "Error", f"No se pudo mover {file_path}:\n{e}")
-        
-        self.refresh_groups()
-        QMessageBox.information(self, "Listo", f"Se movieron {moved} archivos.")
+        self.start_operation(selected_files, "move", folder)
 
-    def refresh_groups(self):
-        selected_files = set(self.get_selected_files())
-        
-        remaining_duplicates = {}
-        for hash_key, files in self.images.items():
-            remaining_files = [f for f in files if os.path.exists(f)]
-            if len(remaining_files) > 1:
-                remaining_duplicates[hash_key] = remaining_files
-        
-        self.images = remaining_duplicates
-        
-        self.group_widgets = []
-        current_thumb = self.get_current_thumb_size()
-        is_compact = self.compact_mode.isChecked()
-        for files in remaining_duplicates.values():
-            group_widget = ImageGroupWidget(files, thumb_size=current_thumb, compact=is_compact)
-            self.group_widgets.append(group_widget)
-            
-            for file_path in files:
-                if file_path in selected_files:
-                    for btn in group_widget.image_buttons:
-                        if hasattr(btn, 'file_path') and btn.file_path == file_path:
-                            btn.setChecked(True)
-                            group_widget.selected_files.add(file_path)
-                            break
-        
-        self.total_pages = max(1, (len(self.group_widgets) + self.groups_per_page - 1) // self.groups_per_page)
-        
-        if self.current_page > self.total_pages:
-            self.current_page = self.total_pages
-        
-        self.show_page(self.current_page)
-        
-        if self.total_pages > 1:
-            self.pagination_panel.show()
+    def link_selected(self):
+        # Cada seleccionado pasa a ser un enlace a la primera imagen sin seleccionar de su grupo
+        keep = self.groups_model.store.link_targets()
+        if not keep:
+            QMessageBox.information(self, "Atención",
+                                    "Selecciona en algún grupo los duplicados a enlazar "
+                                    "y deja sin seleccionar la imagen que se conserva.")
+            return
+
+        reply = QMessageBox.question(self, "Confirmar enlace",
+                                     f"¿Sustituir {len(keep)} archivos por enlaces a la imagen conservada "
+                                     "de su grupo?\nSolo se enlazan los que tengan exactamente el mismo contenido.",
+                                     QMessageBox.Yes | QMessageBox.No)
+
+        if reply == QMessageBox.Yes:
+            self.start_operation(list(keep), "link", keep=keep)
+
+    def refresh_groups(self, removed=None):
+        # Con ``removed`` se quitan esas rutas sin consultar el disco por cada archivo
+        store = self.groups_model.store
+        if removed is not None and self.scan_state is not None:
+            # La búsqueda ya olvidó esas rutas y partió los grupos que toca
+            remaining = self.scan_state.results()
+            remaining.select_paths(set(self.get_selected_files()) - removed)
         else:
-            self.pagination_panel.hide()
+            if removed is not None:
+                keep = np.fromiter((path not in removed for path in store.paths()),
+                                   dtype=bool, count=store.file_count)
+            else:
+                keep = np.fromiter((os.path.exists(path) for path in store.paths()),
+                                   dtype=bool, count=store.file_count)
+            remaining = store.filtered(keep)
+        
+        # Conservar la posición del scroll al reconstruir el modelo
+        scroll = self.results_view.verticalScrollBar().value()
+        self.groups_model.set_store(remaining)
+        self.results_view.doItemsLayout()
+        self.results_view.verticalScrollBar().setValue(scroll)
         
         # Actualizar estadísticas
-        if remaining_duplicates:
-            total_groups = len(remaining_duplicates)
-            total_images = sum(len(files) for files in remaining_duplicates.values())
+        if len(remaining):
+            total_groups = len(remaining)
+            total_images = remaining.file_count
             total_duplicates = total_images - total_groups
             self.update_stats(total_groups, total_images, total_duplicates)
         else:
@@ -1232,10 +1817,14 @@ class DuplicateFinder(QWidget):
             self.thread.quit()
             if not self.thread.wait(3000):
                 print("Advertencia: El hilo no terminó a tiempo")
-            
+        
+        thumbnail_loader().shutdown()
+        thumbnail_cache.trim_disk()
         event.accept()
 
 if __name__ == "__main__":
+    # Necesario para el pool de procesos en el ejecutable de PyInstaller
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = DuplicateFinder()
     window.show()
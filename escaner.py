@@ -0,0 +1,2221 @@
+"""Motor de búsqueda de duplicados de ImageSnapPurge, sin dependencias de Qt.
+
+Lo usa la interfaz gráfica (``duplicados.py``) y también puede ejecutarse
+desde la línea de comandos::
+
+    python -m escaner CARPETA [--threshold N] [--exclude-subfolders] [--format json|csv]
+"""
+import os
+import io
+import sys
+import csv
+import json
+import time
+import heapq
+import math
+import itertools
+import contextlib
+import importlib.util
+import argparse
+import numpy as np
+import multiprocessing
+import concurrent.futures
+import sqlite3
+import hashlib
+import fnmatch
+import re
+from collections import namedtuple, deque
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+# PIL e imagehash (que arrastra scipy y PyWavelets) se importan dentro de las
+# funciones que los usan: la interfaz arranca sin cargarlos y los procesos
+# del pool los cargan con la primera imagen
+
+# Lado mínimo con el que se decodifican los JPEG para calcular el hash; phash
+# trabaja a 32x32, así que 256 deja margen y permite decodificar a 1/8
+HASH_DECODE_SIZE = 256
+
+def open_reduced(path, size, mode=None):
+    """Abre una imagen pidiendo al decodificador una resolución reducida.
+
+    En JPEG, ``draft`` escala en el propio DCT a 1/2, 1/4 u 1/8 sin bajar
+    de ``size`` píxeles por lado; en los demás formatos no tiene efecto.
+    """
+    from PIL import Image
+    img = Image.open(path)
+    img.draft(mode, (size, size))
+    return img
+
+# Algoritmo -> función de imagehash
+HASH_ALGORITHMS = {
+    "phash": "phash",
+    "dhash": "dhash",
+    "ahash": "average_hash",
+    "whash": "whash",
+    "colorhash": "colorhash",
+}
+# Bits de los hashes que no son de 8x8, para escalar el radio
+HASH_BITS = {"colorhash": 14 * 3}
+# "pixels" verifica comparando la imagen reducida a PIXEL_SIDE x PIXEL_SIDE en grises
+VERIFY_METHODS = tuple(HASH_ALGORITHMS) + ("pixels",)
+PIXEL_SIDE = 16
+
+def compute_hash(img, algorithm):
+    if algorithm == "pixels":
+        from PIL import Image
+        small = img.convert("L").resize((PIXEL_SIDE, PIXEL_SIDE), Image.BILINEAR)
+        return int.from_bytes(small.tobytes(), "big")
+    import imagehash
+    return hash_to_int(getattr(imagehash, HASH_ALGORITHMS[algorithm])(img))
+
+# Las 8 simetrías del cuadrado (giros y espejos), empezando por la identidad;
+# son nombres de constantes de PIL.Image
+DIHEDRAL_TRANSFORMS = (None, "ROTATE_90", "ROTATE_180", "ROTATE_270",
+                       "FLIP_LEFT_RIGHT", "FLIP_TOP_BOTTOM",
+                       "TRANSPOSE", "TRANSVERSE")
+# "canonical" se queda con el menor de los 8 hashes; "probe" los guarda todos
+DIHEDRAL_MODES = ("canonical", "probe")
+# Lado del búfer en grises que se gira; phash trabaja a 32x32 y whash a 64
+DIHEDRAL_SIDE = 64
+
+def dihedral_hashes(img, algorithm, transforms=DIHEDRAL_TRANSFORMS):
+    """Hashes de las orientaciones ``transforms`` de ``img`` sin volver a decodificarla."""
+    if algorithm == "colorhash":
+        # El histograma de colores no depende de la orientación
+        return [compute_hash(img, algorithm)] * len(transforms)
+    from PIL import Image
+    # Reducir una sola vez: girar y hashear 8 veces un búfer de 64x64 es barato
+    gray = img.convert("L").resize((DIHEDRAL_SIDE, DIHEDRAL_SIDE), Image.BILINEAR)
+    return [compute_hash(gray if t is None else gray.transpose(getattr(Image, t)), algorithm)
+            for t in transforms]
+
+def image_signature(img, algorithms=("phash",), dihedral=None):
+    """Hash (o firma) de una imagen ya abierta; ver ``hash_image``."""
+    values = []
+    for algorithm in algorithms:
+        if dihedral is None:
+            values.append(compute_hash(img, algorithm))
+        elif dihedral == "canonical":
+            values.append(min(dihedral_hashes(img, algorithm)))
+        else:
+            # La orientación sin girar se calcula como sin ``dihedral``, para
+            # que coincida con los hashes de una búsqueda normal o de un índice
+            values.append(compute_hash(img, algorithm))
+            values.extend(dihedral_hashes(img, algorithm, DIHEDRAL_TRANSFORMS[1:]))
+    return values[0] if len(values) == 1 else tuple(values)
+
+def decode_mode(algorithms):
+    # colorhash necesita color; los demás trabajan en grises
+    return "RGB" if "colorhash" in algorithms else "L"
+
+# Resultado de hash_image; los tiempos son de decodificación y de cálculo del hash
+HashResult = namedtuple("HashResult", "path hash dims error error_type decode_time hash_time")
+
+def hash_image(path, algorithms=("phash",), dihedral=None, draft=True, data=None):
+    """Calcula los hashes de ``algorithms`` a partir de una sola decodificación.
+
+    Devuelve un ``HashResult``. Con un solo valor el hash es un entero; si
+    no, una tupla (la firma). Con ``dihedral="probe"`` cada algoritmo aporta
+    sus 8 orientaciones seguidas. Las dimensiones son las originales, leídas
+    de la cabecera antes de reducir la imagen (``draft=False`` decodifica
+    a tamaño completo, para comparar). Con ``data`` se decodifican esos
+    bytes, ya leídos, en lugar de abrir ``path``.
+    """
+    # Se ejecuta dentro de los procesos del pool, por eso es una función de
+    # módulo (tiene que poder serializarse) y nunca lanza excepciones
+    start = time.perf_counter()
+    try:
+        from PIL import Image
+        with Image.open(path if data is None else io.BytesIO(data)) as img:
+            # Como en open_reduced, pero ``draft`` cambia ``size``
+            dims = img.size
+            if draft:
+                img.draft(decode_mode(algorithms), (HASH_DECODE_SIZE, HASH_DECODE_SIZE))
+            img.load()
+            decoded = time.perf_counter()
+            h = image_signature(img, algorithms, dihedral)
+            return HashResult(path, h, dims, None, None, decoded - start, time.perf_counter() - decoded)
+    except Exception as e:
+        return HashResult(path, None, None, str(e), type(e).__name__, time.perf_counter() - start, 0.0)
+
+def primary_hash(h):
+    # En la verificación en cascada cada archivo tiene una firma (hash, verificación)
+    return h[0] if isinstance(h, tuple) else h
+
+def read_file(path):
+    """Lee ``path`` entero; devuelve los bytes y los segundos que tardó."""
+    # Corre en los hilos de lectura anticipada: la E/S suelta el GIL
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        data = f.read()
+    return data, time.perf_counter() - start
+
+def hash_to_int(h):
+    # Un phash de 8x8 cabe en un entero de 64 bits. Los enteros se usan como
+    # claves en todo el motor: el __hash__ de ImageHash solo toma unos pocos
+    # miles de valores distintos y los diccionarios grandes colisionan
+    return int(str(h), 16)
+
+def hash_to_hex(h):
+    return format(h, "016x")
+
+def signature_to_text(h):
+    if isinstance(h, tuple):
+        return ":".join(format(x, "x") for x in h)
+    return hash_to_hex(h)
+
+def signature_from_text(text):
+    parts = text.split(":")
+    if len(parts) == 1:
+        return int(text, 16)
+    return tuple(int(x, 16) for x in parts)
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+# Bits a 1 de cada byte, para contar bits en NumPy < 2.0 (sin bitwise_count)
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def popcount64(x):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    x = np.ascontiguousarray(x)
+    return _POPCOUNT_TABLE[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+def merge_labels(labels, a, b):
+    """Une los grupos de las aristas ``a``-``b`` en ``labels``, sin bucles de Python.
+
+    Cada etiqueta es el menor índice de su grupo. Las raíces se enlazan con
+    la menor de cada arista y se aplanan saltando punteros, hasta que los
+    dos extremos de todas las aristas tienen la misma raíz.
+    """
+    parent = labels.copy()
+    ra, rb = parent[a], parent[b]
+    while len(ra) and (ra != rb).any():
+        low = np.minimum(ra, rb)
+        np.minimum.at(parent, ra, low)
+        np.minimum.at(parent, rb, low)
+        while True:
+            jumped = parent[parent]
+            if (jumped == parent).all():
+                break
+            parent = jumped
+        ra, rb = parent[a], parent[b]
+    return parent
+
+def keep_columns(labels, keep):
+    """Columnas ``keep`` de un ``linkage``, con cada etiqueta de nuevo el menor índice de su grupo."""
+    labels = labels[:, keep]
+    for t, row in enumerate(labels):
+        # La primera aparición de cada etiqueta es la columna más baja del grupo
+        _, first, inverse = np.unique(row, return_index=True, return_inverse=True)
+        labels[t] = first[inverse]
+    return labels
+
+def flip_masks(width, count):
+    """Máscaras de ``width`` bits con ``count`` bits a 1 como mucho, de menos a más."""
+    masks = [0]
+    for k in range(1, count + 1):
+        masks.extend(sum(1 << bit for bit in bits) for bits in itertools.combinations(range(width), k))
+    return np.array(masks, dtype=np.uint64)
+
+def hash_bands(bits, count):
+    """(desplazamiento, ancho) de ``count`` bandas contiguas que cubren los ``bits`` bajos."""
+    width, extra = divmod(bits, count)
+    bands = []
+    shift = 0
+    for k in range(count):
+        bands.append((shift, width + (k < extra)))
+        shift += bands[-1][1]
+    return bands
+
+def default_cache_path():
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "ImageSnapPurge", "hashes.sqlite3")
+
+# Bytes del principio y del final que se leen para el digest parcial
+PARTIAL_DIGEST_BYTES = 64 * 1024
+
+def file_digest(path, size, partial=False):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        if partial and size > 2 * PARTIAL_DIGEST_BYTES:
+            digest.update(f.read(PARTIAL_DIGEST_BYTES))
+            f.seek(-PARTIAL_DIGEST_BYTES, os.SEEK_END)
+            digest.update(f.read(PARTIAL_DIGEST_BYTES))
+        else:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.digest()
+
+class HashCache:
+    """Índice persistente de hashes guardado en SQLite.
+
+    Cada entrada se valida con (tamaño, mtime_ns, inodo) del archivo; si
+    alguno cambió, la imagen se vuelve a decodificar. Junto al hash se
+    guardan las dimensiones de la imagen. Las escrituras se agrupan en
+    lotes para no hacer un commit por imagen.
+    """
+    # 2: hashes calculados sobre la decodificación reducida de los JPEG
+    # 3: manifiesto de carpetas para la búsqueda incremental
+    # 4: una fila por archivo y combinación de algoritmos
+    # 5: ancho y alto de cada imagen
+    # 6: al sondear orientaciones, la sin girar se calcula como sin ellas
+    SCHEMA_VERSION = 6
+    BATCH_SIZE = 500
+
+    def __init__(self, path=None, algorithm="phash"):
+        self.path = path or default_cache_path()
+        self.algorithm = algorithm
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != self.SCHEMA_VERSION:
+            # Es solo una caché: si el formato cambió se reconstruye
+            self.conn.execute("DROP TABLE IF EXISTS hashes")
+            self.conn.execute("DROP TABLE IF EXISTS dirs")
+            self.conn.execute("""
+                CREATE TABLE hashes (
+                    path TEXT NOT NULL,
+                    algorithm TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    hash TEXT NOT NULL,
+                    width INTEGER NOT NULL,
+                    height INTEGER NOT NULL,
+                    PRIMARY KEY (path, algorithm)
+                )
+            """)
+            # mtime_ns es NULL en las subcarpetas vistas pero no recorridas
+            self.conn.execute("""
+                CREATE TABLE dirs (
+                    path TEXT PRIMARY KEY,
+                    parent TEXT,
+                    mtime_ns INTEGER
+                )
+            """)
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self.conn.commit()
+        self.pending = []
+
+    @staticmethod
+    def _path_range(folder):
+        # Todas las rutas bajo la carpeta quedan en [prefijo, fin) al ordenar como texto
+        prefix = os.path.join(os.path.abspath(folder), "")
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    def load(self, folder):
+        """Devuelve las entradas guardadas bajo ``folder`` como diccionario por ruta."""
+        rows = self.conn.execute(
+            "SELECT path, size, mtime_ns, inode, hash, width, height FROM hashes "
+            "WHERE path >= ? AND path < ? AND algorithm = ?",
+            self._path_range(folder) + (self.algorithm,))
+        return {path: (size, mtime_ns, inode, signature_from_text(text), width, height)
+                for path, size, mtime_ns, inode, text, width, height in rows}
+
+    def load_files(self, folder):
+        """Devuelve el stat guardado de cada archivo bajo ``folder``, con cualquier algoritmo.
+
+        El manifiesto de carpetas es común a todos los algoritmos, así que
+        una búsqueda incremental lista las carpetas sin cambios con esto
+        aunque falte el hash del algoritmo actual.
+        """
+        rows = self.conn.execute(
+            "SELECT path, size, MAX(mtime_ns), inode FROM hashes "
+            "WHERE path >= ? AND path < ? GROUP BY path",
+            self._path_range(folder))
+        return {path: (size, mtime_ns, inode) for path, size, mtime_ns, inode in rows}
+
+    @staticmethod
+    def lookup(entries, path, st):
+        """``(hash, (ancho, alto))`` si la entrada sigue valiendo, si no ``None``."""
+        entry = entries.get(os.path.abspath(path))
+        if entry is None:
+            return None
+        size, mtime_ns, inode, h, width, height = entry
+        if (size, mtime_ns, inode) != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+        return h, (width, height)
+
+    def load_dirs(self, folder):
+        """Devuelve el manifiesto de ``folder``: ``{carpeta: (padre, mtime_ns)}``."""
+        start, end = self._path_range(folder)
+        rows = self.conn.execute(
+            "SELECT path, parent, mtime_ns FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+            (os.path.abspath(folder), start, end))
+        return {path: (parent, mtime_ns) for path, parent, mtime_ns in rows}
+
+    def store_dirs(self, folder, dirs, recursive=True):
+        """Guarda el manifiesto de carpetas de una búsqueda completa.
+
+        ``dirs`` es ``{carpeta: (padre, mtime_ns)}``. En una búsqueda sin
+        subcarpetas solo se actualiza la carpeta principal y se añaden sus
+        hijas sin pisar lo que ya se sabía de ellas.
+        """
+        self.flush()
+        folder = os.path.abspath(folder)
+        if recursive:
+            start, end = self._path_range(folder)
+            self.conn.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                              (folder, start, end))
+            self.conn.executemany("INSERT INTO dirs VALUES (?, ?, ?)",
+                                  ((path, parent, mtime_ns)
+                                   for path, (parent, mtime_ns) in dirs.items()))
+        else:
+            self.conn.executemany("INSERT OR IGNORE INTO dirs VALUES (?, ?, ?)",
+                                  ((path, parent, mtime_ns)
+                                   for path, (parent, mtime_ns) in dirs.items()))
+            parent, mtime_ns = dirs[folder]
+            self.conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+                              (folder, parent, mtime_ns))
+        self.conn.commit()
+
+    def store(self, path, st, h, dims):
+        self.pending.append((os.path.abspath(path), self.algorithm, st.st_size,
+                             st.st_mtime_ns, st.st_ino, signature_to_text(h)) + tuple(dims))
+        if len(self.pending) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.conn.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                  self.pending)
+            self.conn.commit()
+            self.pending = []
+
+    def prune(self, folder, seen_paths, recursive=True):
+        """Elimina las entradas de ``folder`` cuyos archivos ya no aparecieron.
+
+        Si se borró una parte importante del índice se compacta el archivo.
+        """
+        self.flush()
+        start, end = self._path_range(folder)
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM seen")
+        self.conn.executemany("INSERT OR IGNORE INTO seen VALUES (?)",
+                              ((os.path.abspath(p),) for p in seen_paths))
+        rows = self.conn.execute(
+            "SELECT DISTINCT path FROM hashes WHERE path >= ? AND path < ? "
+            "AND path NOT IN (SELECT path FROM seen)", (start, end)).fetchall()
+        folder = os.path.abspath(folder)
+        stale = [(path,) for (path,) in rows
+                 if recursive or os.path.dirname(path) == folder]
+        self.conn.executemany("DELETE FROM hashes WHERE path = ?", stale)
+        self.conn.execute("DELETE FROM seen")
+        self.conn.commit()
+        total = self.conn.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+        if stale and len(stale) * 4 > total:
+            self.conn.execute("VACUUM")
+        return len(stale)
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+# Lo que el motor necesita de un os.stat_result; también se rehace desde la caché
+FileStat = namedtuple("FileStat", "st_size st_mtime_ns st_ino")
+
+class ScanState:
+    """Resultado completo de una búsqueda, para poder actualizarla sin repetirla.
+
+    Guarda el hash y el stat de cada archivo y los grupos de hashes similares
+    (incluidos los que tienen un solo archivo). Si la búsqueda calculó los
+    grupos de varios umbrales (``Scanner.linkage``), ``regroup`` cambia de
+    umbral al instante.
+    """
+
+    def __init__(self, folder, exclude_subfolders, radius, hash_key="phash"):
+        self.folder = os.path.abspath(folder)
+        self.exclude_subfolders = exclude_subfolders
+        self.radius = radius
+        self.hash_key = hash_key  # algoritmos y orientaciones, como en HashCache
+        self.images = {}    # hash (o firma) -> [rutas]
+        self.entries = {}   # ruta -> (tamaño, mtime_ns, inodo, hash, ancho, alto), como en HashCache
+        self.group_of = {}  # hash -> id de grupo
+        self.groups = {}    # id de grupo -> set de hashes
+        self.dirs = {}      # carpeta -> (padre, mtime_ns)
+        self.linkage = None       # umbrales x hashes: etiqueta de grupo, de Scanner.linkage
+        self.linkage_keys = None  # hash de cada columna de ``linkage``
+        self.radii = None         # radio de cada umbral de ``linkage``
+        self._next_group = 0
+
+    def covers(self, folder, exclude_subfolders, hash_key="phash"):
+        return ((self.folder, self.exclude_subfolders, self.hash_key)
+                == (os.path.abspath(folder), exclude_subfolders, hash_key))
+
+    def new_group(self, members):
+        gid = self._next_group
+        self._next_group += 1
+        self.groups[gid] = set(members)
+        for h in members:
+            self.group_of[h] = gid
+        return gid
+
+    def merge_groups(self, a, b):
+        if a == b:
+            return a
+        if len(self.groups[a]) < len(self.groups[b]):
+            a, b = b, a
+        members = self.groups.pop(b)
+        for h in members:
+            self.group_of[h] = a
+        self.groups[a].update(members)
+        return a
+
+    def can_regroup(self, threshold):
+        return self.linkage is not None and 0 <= threshold < len(self.linkage)
+
+    def set_labels(self, labels):
+        """Rehace los grupos a partir de una fila de ``linkage``."""
+        self.groups = {}
+        self.group_of = {}
+        self._next_group = 0
+        members = {}
+        for h, label in zip(self.linkage_keys, labels.tolist()):
+            members.setdefault(label, []).append(h)
+        for group in members.values():
+            self.new_group(group)
+
+    def regroup(self, threshold):
+        """Pasa a los grupos de ``threshold`` sin comparar ningún hash."""
+        self.set_labels(self.linkage[threshold])
+        self.radius = self.radii[threshold]
+
+    def discard(self, paths):
+        """Olvida ``paths`` (borrados, movidos o enlazados fuera de la búsqueda).
+
+        Devuelve los hashes que se quedan sin archivos. Los grupos no se
+        tocan: quitar un hash puede partirlos, y eso lo hace ``Scanner.discard``.
+        """
+        gone = set()
+        for path in paths:
+            entry = self.entries.pop(path, None)
+            if entry is None:
+                continue
+            h = entry[3]
+            files = self.images.get(h)
+            if files is None:
+                continue
+            if path in files:
+                files.remove(path)
+            if not files:
+                del self.images[h]
+                gone.add(h)
+        return gone
+
+    def duplicates(self):
+        duplicates = {}
+        for members in self.groups.values():
+            hashes = sorted(members)
+            files = [path for h in hashes for path in self.images[h]]
+            if len(files) > 1:
+                duplicates[hashes[0]] = files
+        return duplicates
+
+    def results(self):
+        """Los grupos de duplicados como ``ResultStore``, con los datos de cada archivo."""
+        return ResultStore.from_groups(
+            ([(primary_hash(h), path) for h in sorted(members) for path in self.images[h]]
+             for members in self.groups.values()),
+            self.entries)
+
+# Tamaño, fecha y dimensiones de cada archivo, tal como se vieron al buscar
+FILE_INFO_DTYPE = np.dtype([("size", np.int64), ("mtime_ns", np.int64),
+                            ("width", np.int32), ("height", np.int32)])
+
+# Lados de una comparación de conjuntos; en ``ResultStore.roles`` van como índice
+ROLES = ("reference", "candidate")
+
+# Formatos de mejor a peor para la política "format": los sin pérdida primero
+FORMAT_RANK = {".png": 3, ".bmp": 2, ".jpg": 1, ".jpeg": 1, ".gif": 0}
+
+def keep_resolution(store, pattern=None):
+    # Mayor área; en empate, más bytes; luego la más reciente
+    info = store.info
+    return [info["width"].astype(np.int64) * info["height"], info["size"], info["mtime_ns"]]
+
+def keep_format(store, pattern=None):
+    # Compara el final de cada nombre en la cadena de nombres, sin sacarlos uno a uno
+    chars = np.frombuffer(store.names.encode("utf-32-le"), dtype="<u4")
+    ends = store.name_ends
+    lengths = np.diff(ends, prepend=0)
+    rank = np.full(store.file_count, -1, dtype=np.int8)
+    for ext, value in FORMAT_RANK.items():
+        hit = lengths >= len(ext)
+        for k, char in enumerate(ext):
+            # | 0x20 pasa las letras ASCII a minúsculas y deja el punto igual
+            hit &= (chars[np.maximum(ends - len(ext) + k, 0)] | 0x20) == ord(char)
+        rank[hit] = value
+    return [rank] + keep_resolution(store)
+
+def keep_oldest(store, pattern=None):
+    return [-store.info["mtime_ns"]] + keep_resolution(store)
+
+def keep_path(store, pattern=None):
+    # Se conserva la que coincide con el patrón (estilo fnmatch, sobre la ruta completa)
+    if not pattern:
+        raise ValueError("La política \"path\" necesita un patrón")
+    match = re.compile(fnmatch.translate(os.path.normcase(pattern))).match
+    hits = np.fromiter((match(os.path.normcase(path)) is not None for path in store.paths()),
+                       dtype=bool, count=store.file_count)
+    return [hits] + keep_resolution(store)
+
+def keep_reference(store, pattern=None):
+    # Al comparar conjuntos se conserva la copia del conjunto de referencia
+    if store.roles is None:
+        return keep_resolution(store)
+    return [store.roles == ROLES.index("reference")] + keep_resolution(store)
+
+# Cada política devuelve claves por archivo, de mayor a menor prioridad, en
+# las que un valor mayor es mejor; ``ResultStore.keep_best`` las aplica
+KEEP_POLICIES = {
+    "resolution": keep_resolution,
+    "format": keep_format,
+    "oldest": keep_oldest,
+    "path": keep_path,
+    "reference": keep_reference,
+}
+
+class ResultStore:
+    """Grupos de duplicados guardados en arrays compactos.
+
+    Cada archivo tiene un id. Su ruta se guarda como (carpeta internada,
+    nombre), con todos los nombres seguidos en una sola cadena; su hash va
+    en un array uint64, su tamaño, fecha y dimensiones en un array
+    estructurado (``FILE_INFO_DTYPE``) y su marca de selección en un array
+    de booleanos. Los archivos de un grupo tienen ids consecutivos: el grupo
+    ``g`` ocupa ``offsets[g]:offsets[g + 1]``. Así no hace falta una lista
+    por grupo, y seleccionar, invertir o contar son operaciones de NumPy.
+    Al comparar conjuntos, ``roles`` (int8) dice el lado de cada archivo
+    como índice en ``ROLES``; en las búsquedas normales es ``None``.
+    """
+
+    def __init__(self, dirs, dir_ids, names, hashes, offsets, selected=None, info=None, roles=None):
+        self.dirs = dirs          # carpetas distintas
+        self.dir_ids = dir_ids    # int32: carpeta de cada archivo
+        self.names = "".join(names)
+        self.name_ends = np.cumsum([len(name) for name in names], dtype=np.int64)
+        self.hashes = hashes      # uint64: hash de cada archivo
+        self.offsets = offsets    # int64: inicio de cada grupo, más el final
+        self.selected = selected if selected is not None else np.zeros(len(names), dtype=bool)
+        self.info = info if info is not None else np.zeros(len(names), dtype=FILE_INFO_DTYPE)
+        self.roles = roles
+        self.group_of = np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets))
+
+    @classmethod
+    def from_groups(cls, groups, entries=None, roles=None):
+        """Crea el almacén a partir de pares (hash, ruta) por grupo.
+
+        Los grupos con un solo archivo se descartan. ``entries`` son las
+        entradas de ``ScanState``, de donde salen tamaño, fecha y dimensiones;
+        lo que falte queda a cero. ``roles`` es ``{ruta: rol}`` al comparar
+        conjuntos.
+        """
+        entries = entries or {}
+        dirs = []
+        dir_index = {}
+        dir_ids = []
+        names = []
+        hashes = []
+        info = []
+        role_ids = []
+        offsets = [0]
+        for group in groups:
+            group = list(group)
+            if len(group) < 2:
+                continue
+            for h, path in group:
+                folder, name = os.path.split(path)
+                d = dir_index.get(folder)
+                if d is None:
+                    d = dir_index[folder] = len(dirs)
+                    dirs.append(folder)
+                dir_ids.append(d)
+                names.append(name)
+                hashes.append(h)
+                entry = entries.get(path)
+                info.append((entry[0], entry[1], entry[4], entry[5]) if entry else (0, 0, 0, 0))
+                if roles is not None:
+                    role_ids.append(ROLES.index(roles[path]))
+            offsets.append(len(names))
+        return cls(dirs, np.array(dir_ids, dtype=np.int32), names,
+                   np.array(hashes, dtype=np.uint64), np.array(offsets, dtype=np.int64),
+                   info=np.array(info, dtype=FILE_INFO_DTYPE),
+                   roles=None if roles is None else np.array(role_ids, dtype=np.int8))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def file_count(self):
+        return len(self.name_ends)
+
+    def name(self, i):
+        start = self.name_ends[i - 1] if i else 0
+        return self.names[start:self.name_ends[i]]
+
+    def path(self, i):
+        return os.path.join(self.dirs[self.dir_ids[i]], self.name(i))
+
+    def role(self, i):
+        return None if self.roles is None else ROLES[self.roles[i]]
+
+    def paths(self):
+        for i in range(self.file_count):
+            yield self.path(i)
+
+    def group_ids(self, g):
+        return range(self.offsets[g], self.offsets[g + 1])
+
+    def group_size(self, g):
+        return int(self.offsets[g + 1] - self.offsets[g])
+
+    def group_files(self, g):
+        return [self.path(i) for i in self.group_ids(g)]
+
+    def group_hash(self, g):
+        return int(self.hashes[self.offsets[g]:self.offsets[g + 1]].min())
+
+    def to_dict(self):
+        """``{hash: [rutas]}``, el mismo formato que devuelve ``Scanner.run``."""
+        return {self.group_hash(g): self.group_files(g) for g in range(len(self))}
+
+    def select_all(self):
+        self.selected[:] = True
+
+    def deselect_all(self):
+        self.selected[:] = False
+
+    def invert_selection(self):
+        np.logical_not(self.selected, out=self.selected)
+
+    def toggle(self, i):
+        self.selected[i] = not self.selected[i]
+
+    def set_group_selection(self, g, ids):
+        self.selected[self.offsets[g]:self.offsets[g + 1]] = False
+        self.selected[list(ids)] = True
+
+    def selected_count(self):
+        return int(np.count_nonzero(self.selected))
+
+    def selected_paths(self):
+        return [self.path(i) for i in np.flatnonzero(self.selected)]
+
+    def best_files(self, keys):
+        """Id del mejor archivo de cada grupo según ``keys``.
+
+        ``keys`` son arrays por archivo, de mayor a menor prioridad, en los
+        que gana el valor mayor; en empate gana el primero del grupo. Un
+        solo ``lexsort`` ordena todos los grupos a la vez.
+        """
+        ids = np.arange(self.file_count)
+        order = np.lexsort([-ids] + list(keys)[::-1] + [self.group_of])
+        return order[self.offsets[1:] - 1]
+
+    def keep_best(self, policy="resolution", pattern=None):
+        """Selecciona todos los archivos menos el mejor de cada grupo según ``policy``."""
+        if policy not in KEEP_POLICIES:
+            raise ValueError(f"Política de conservación desconocida: {policy}")
+        if not len(self):
+            return 0
+        best = self.best_files(KEEP_POLICIES[policy](self, pattern))
+        self.selected[:] = True
+        self.selected[best] = False
+        return len(best)
+
+    def link_targets(self):
+        """``{ruta seleccionada: primera ruta sin seleccionar de su grupo}``.
+
+        Los grupos con todo seleccionado o nada seleccionado no aportan nada.
+        """
+        targets = {}
+        for g in range(len(self)):
+            start, end = self.offsets[g], self.offsets[g + 1]
+            mask = self.selected[start:end]
+            if mask.all() or not mask.any():
+                continue
+            keep = self.path(start + int(np.argmin(mask)))
+            for i in np.flatnonzero(mask):
+                targets[self.path(start + int(i))] = keep
+        return targets
+
+    def select_paths(self, paths):
+        if not paths or not self.file_count:
+            return
+        paths = set(paths)
+        hits = [i for i, path in enumerate(self.paths()) if path in paths]
+        self.selected[hits] = True
+
+    def filtered(self, keep):
+        """Copia sin los archivos con ``keep`` a False, conservando la selección.
+
+        Los grupos que quedan con menos de dos archivos desaparecen.
+        """
+        if not len(self):
+            return self
+        counts = np.add.reduceat(keep.astype(np.int64), self.offsets[:-1])
+        mask = keep & (counts >= 2)[self.group_of]
+        kept = counts[counts >= 2]
+        offsets = np.zeros(len(kept) + 1, dtype=np.int64)
+        np.cumsum(kept, out=offsets[1:])
+        names = [self.name(i) for i in np.flatnonzero(mask)]
+        return ResultStore(self.dirs, self.dir_ids[mask], names, self.hashes[mask],
+                           offsets, self.selected[mask], self.info[mask],
+                           None if self.roles is None else self.roles[mask])
+
+class ScanProfile:
+    """Métricas de una búsqueda: fases, rendimiento, formatos, errores y agrupación.
+
+    ``snapshot`` resume el estado para mostrarlo mientras se busca y
+    ``to_dict`` da el perfil completo, que ``dump`` guarda como JSON.
+    """
+    SLOWEST = 10
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}       # fase -> segundos
+        self.files = 0         # archivos registrados
+        self.cached = 0        # sin leer: de la caché o de la búsqueda anterior
+        self.copies = 0        # copias exactas, que heredan el hash
+        self.hashed = 0        # decodificados en el pool
+        self.bytes_read = 0
+        self.formats = {}      # extensión -> [archivos, segundos decodificando, segundos hasheando]
+        self.slowest = []      # montículo de (segundos, ruta)
+        self.errors = {}       # tipo de error -> cantidad
+        self.comparisons = 0
+        self.candidate_pairs = 0
+        self.confirmed_pairs = 0
+        # Lectura anticipada: lecturas en vuelo configuradas (0 si lee cada
+        # proceso), cola actual y máxima y bytes leídos que aún no se hashearon
+        self.prefetch = 0
+        self.reads = 0
+        self.read_seconds = 0.0
+        self.queue_depth = 0
+        self.ready = 0
+        self.bytes_in_flight = 0
+        self.max_queue_depth = 0
+        self.max_bytes_in_flight = 0
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def add_hashed(self, path, size, decode_time, hash_time):
+        self.hashed += 1
+        self.bytes_read += size
+        ext = os.path.splitext(path)[1].lower()
+        stats = self.formats.setdefault(ext, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += decode_time
+        stats[2] += hash_time
+        item = (decode_time + hash_time, path)
+        if len(self.slowest) < self.SLOWEST:
+            heapq.heappush(self.slowest, item)
+        elif item > self.slowest[0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def add_error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def add_read(self, seconds):
+        self.reads += 1
+        self.read_seconds += seconds
+
+    def set_queue(self, depth, ready, bytes_in_flight):
+        self.queue_depth = depth
+        self.ready = ready
+        self.bytes_in_flight = bytes_in_flight
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        self.max_bytes_in_flight = max(self.max_bytes_in_flight, bytes_in_flight)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def snapshot(self):
+        elapsed = self.elapsed() or 1e-9
+        snapshot = {
+            "elapsed": elapsed,
+            "files": self.files,
+            "hashed": self.hashed,
+            "files_per_second": self.files / elapsed,
+            "mb_per_second": self.bytes_read / 2 ** 20 / elapsed,
+            "errors": sum(self.errors.values()),
+        }
+        if self.prefetch:
+            snapshot.update({
+                "queue_depth": self.queue_depth,
+                "ready": self.ready,
+                "mb_in_flight": self.bytes_in_flight / 2 ** 20,
+            })
+        return snapshot
+
+    def to_dict(self):
+        profile = self.snapshot()
+        grouping = self.phases.get("grouping")
+        profile.update({
+            "cached": self.cached,
+            "copies": self.copies,
+            "bytes_read": self.bytes_read,
+            "phases": dict(self.phases),
+            "formats": {ext: {"files": n, "decode_seconds": d, "hash_seconds": h}
+                        for ext, (n, d, h) in sorted(self.formats.items())},
+            "slowest": [{"path": path, "seconds": seconds}
+                        for seconds, path in sorted(self.slowest, reverse=True)],
+            "errors_by_type": dict(self.errors),
+            "grouping": {
+                "comparisons": self.comparisons,
+                "comparisons_per_second": self.comparisons / grouping if grouping else None,
+                "candidate_pairs": self.candidate_pairs,
+                "confirmed_pairs": self.confirmed_pairs,
+            },
+        })
+        if self.prefetch:
+            profile["prefetch"] = {
+                "depth": self.prefetch,
+                "reads": self.reads,
+                "read_seconds": self.read_seconds,
+                "max_queue_depth": self.max_queue_depth,
+                "max_mb_in_flight": self.max_bytes_in_flight / 2 ** 20,
+            }
+        return profile
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            f.write("\n")
+
+@contextlib.contextmanager
+def profiler(kind=None, output=None):
+    """Perfila el bloque con ``"cprofile"`` o ``"pyinstrument"`` (si está instalado).
+
+    Sin ``output`` el informe se escribe en stderr; con él, cProfile guarda
+    sus estadísticas (para ``pstats`` o snakeviz) y pyinstrument un HTML.
+    Solo se ve el proceso principal: el hash corre en los procesos del pool.
+    """
+    if kind is None:
+        yield
+        return
+    if kind == "cprofile":
+        import cProfile
+        import pstats
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            if output:
+                prof.dump_stats(output)
+            else:
+                pstats.Stats(prof, stream=sys.stderr).sort_stats("cumulative").print_stats(25)
+    elif kind == "pyinstrument":
+        from pyinstrument import Profiler
+        prof = Profiler()
+        prof.start()
+        try:
+            yield
+        finally:
+            prof.stop()
+            if output:
+                with open(output, "w", encoding="utf-8") as f:
+                    f.write(prof.output_html())
+            else:
+                sys.stderr.write(prof.output_text())
+    else:
+        raise ValueError(f"Perfilador desconocido: {kind}")
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+class Scanner:
+    """Busca imágenes duplicadas en una carpeta sin depender de Qt.
+
+    ``run`` devuelve un diccionario ``{hash: [rutas]}`` con los grupos de
+    duplicados, o ``None`` si se canceló con ``stop``. Con ``verify`` la
+    agrupación va en cascada: ``algorithm`` propone pares candidatos y el
+    segundo hash (o la comparación de píxeles) los confirma; en ese caso
+    las claves son firmas ``(hash, verificación)`` y los contadores
+    ``candidate_pairs`` y ``confirmed_pairs`` sirven para ajustar el umbral.
+    ``dihedral`` encuentra también copias giradas o en espejo. El progreso (0-100)
+    se comunica llamando a ``progress``, y cada ``STATS_INTERVAL`` segundos
+    se llama a ``stats`` con un resumen de ``profile`` (un ``ScanProfile``
+    con las métricas de la búsqueda). Al terminar, ``state`` guarda el
+    resultado completo; si se pasa como ``previous`` a la siguiente
+    búsqueda de la misma carpeta, los grupos se actualizan en su sitio.
+    Con ``incremental`` además no se listan las carpetas que no cambiaron.
+    Con ``prefetch`` unos hilos mantienen ese número de lecturas en vuelo y
+    pasan los bytes a los procesos, que solo decodifican: en unidades de red
+    la latencia queda oculta detrás del cálculo.
+    """
+
+    # Segundos máximos que se espera a los procesos antes de revisar si se canceló
+    POLL_INTERVAL = 0.25
+    # Lado de los bloques de la matriz de distancias del motor NumPy
+    # (1024 x 1024 x 8 bytes = 8 MB por bloque)
+    TILE_SIZE = 1024
+    GROUPING_BACKENDS = ("bands", "numpy")
+    # Coste de consultar una clave en una banda y de comprobar un candidato,
+    # relativo a una comparación de los bloques de NumPy. Con ellos "bands"
+    # elige el número de bandas o, si no sale a cuenta, recorre los bloques
+    BAND_LOOKUP_COST = 7.0
+    BAND_CANDIDATE_COST = 7.0
+    # Bandas de hasta estos bits se consultan en una tabla directa; las más
+    # anchas, con ``searchsorted`` sobre las claves ordenadas
+    BAND_TABLE_BITS = 22
+    # Claves o pares candidatos que se generan de una vez al consultar las bandas
+    BAND_CHUNK = 1 << 20
+    # Aristas de ``linkage`` que se acumulan antes de unirlas en los grupos
+    LINK_CHUNK = 1 << 22
+    # Segundos mínimos entre dos llamadas a ``stats``
+    STATS_INTERVAL = 0.5
+    # Bytes leídos por adelantado que pueden esperar en memoria a los procesos
+    PREFETCH_BYTES = 256 * 2 ** 20
+
+    def __init__(self, folder, threshold, exclude_subfolders=False, workers=None,
+                 cache_path=None, use_cache=True, grouping="bands", progress=None,
+                 incremental=False, previous=None, algorithm="phash", verify=None,
+                 dihedral=None, stats=None, max_threshold=None, prefetch=0, prefetch_bytes=None):
+        self.folder = folder
+        self.threshold = threshold
+        self.exclude_subfolders = exclude_subfolders
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_path = cache_path
+        self.use_cache = use_cache
+        if grouping not in self.GROUPING_BACKENDS:
+            raise ValueError(f"Motor de agrupación desconocido: {grouping}")
+        self.grouping = grouping
+        if algorithm not in HASH_ALGORITHMS:
+            raise ValueError(f"Algoritmo de hash desconocido: {algorithm}")
+        if verify not in VERIFY_METHODS + (None,):
+            raise ValueError(f"Método de verificación desconocido: {verify}")
+        if verify == algorithm:
+            verify = None
+        if dihedral not in DIHEDRAL_MODES + (None,):
+            raise ValueError(f"Modo de orientación desconocido: {dihedral}")
+        self.algorithms = (algorithm,) + ((verify,) if verify else ())
+        self.verify = verify
+        self.dihedral = dihedral
+        # Hashes por algoritmo en cada firma: 8 orientaciones al sondear
+        self.probes = len(DIHEDRAL_TRANSFORMS) if dihedral == "probe" else 1
+        self.hash_key = "+".join(self.algorithms) + (f"@{dihedral}" if dihedral else "")
+        self.radius = self.radius_for(threshold)
+        if verify:
+            self.verify_radius = self.verify_radius_for(threshold)
+        # Con ``max_threshold`` la agrupación guarda en ``state`` los grupos de
+        # cada umbral hasta ese, para cambiar de umbral sin volver a comparar
+        self.max_threshold = max(threshold, max_threshold) if max_threshold is not None else None
+        self.prefetch = prefetch
+        self.prefetch_bytes = prefetch_bytes or self.PREFETCH_BYTES
+        self.candidate_pairs = 0
+        self.confirmed_pairs = 0
+        self.comparisons = 0
+        self.on_progress = progress
+        self.on_stats = stats
+        self.profile = ScanProfile()
+        self.incremental = incremental
+        # Solo sirve una búsqueda anterior de la misma carpeta y con las mismas opciones
+        if previous is not None and not previous.covers(folder, exclude_subfolders, self.hash_key):
+            previous = None
+        self.previous = previous
+        self.state = None
+        self.dirs = {}
+        self._isRunning = True
+
+    @property
+    def is_running(self):
+        return self._isRunning
+
+    def radius_for(self, threshold):
+        # Radio en bits sobre un hash de 64; los hashes más cortos lo escalan
+        return threshold * 3 * HASH_BITS.get(self.algorithms[0], 64) // 64
+
+    def verify_radius_for(self, threshold):
+        # Solo depende del algoritmo de verificación, no del principal; con
+        # "pixels" es la diferencia media por píxel, de 0 a 255
+        return threshold * 3 * HASH_BITS.get(self.verify, 64) // 64
+
+    def report_error(self, path, error, kind):
+        # Los errores no detienen la búsqueda: se avisan por stderr y se cuentan por tipo
+        print(f"Error con {path}: {error}", file=sys.stderr)
+        self.profile.add_error(kind)
+
+    def open_cache(self):
+        if not self.use_cache:
+            return None
+        try:
+            return HashCache(self.cache_path, self.hash_key)
+        except (OSError, sqlite3.Error) as e:
+            # Sin caché la búsqueda funciona igual, solo que más lenta
+            print(f"No se pudo abrir la caché de hashes: {e}", file=sys.stderr)
+            return None
+
+    def scan_entries(self, manifest=None, known=None):
+        """Recorre la carpeta en una sola pasada con ``os.scandir``.
+
+        Genera ``(ruta, stat)`` a medida que descubre las imágenes; el stat
+        sale del ``DirEntry``, que en Windows ya viene con el listado del
+        directorio y en otros sistemas se pide una sola vez. El mtime de
+        cada carpeta queda en ``self.dirs``.
+
+        Con ``manifest`` (búsqueda incremental) las carpetas cuyo mtime no
+        cambió no se listan: sus subcarpetas salen del manifiesto y sus
+        imágenes de ``known``. Editar una imagen en su sitio no cambia el
+        mtime de la carpeta, así que eso solo lo detecta una búsqueda normal.
+        """
+        files_by_dir = {}
+        children = {}
+        if manifest:
+            for path, entry in (known or {}).items():
+                files_by_dir.setdefault(os.path.dirname(path), []).append(
+                    (path, FileStat(*entry[:3])))
+            for path, (parent, _) in manifest.items():
+                children.setdefault(parent, []).append(path)
+
+        folders = [(os.path.abspath(self.folder), None)]
+        while folders and self._isRunning:
+            folder, parent = folders.pop()
+            try:
+                mtime_ns = os.stat(folder).st_mtime_ns
+            except OSError as e:
+                self.report_error(folder, e, type(e).__name__)
+                continue
+            self.dirs[folder] = (parent, mtime_ns)
+
+            if manifest and manifest.get(folder, (None, None))[1] == mtime_ns:
+                for subfolder in children.get(folder, ()):
+                    if self.exclude_subfolders:
+                        self.dirs.setdefault(subfolder, (folder, None))
+                    else:
+                        folders.append((subfolder, folder))
+                yield from files_by_dir.get(folder, ())
+                continue
+
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        if not self._isRunning:
+                            return
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                # Procesar incluyendo subcarpetas
+                                if self.exclude_subfolders:
+                                    self.dirs.setdefault(entry.path, (folder, None))
+                                else:
+                                    folders.append((entry.path, folder))
+                            elif entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                                yield entry.path, entry.stat()
+                        except OSError as e:
+                            self.report_error(entry.path, e, type(e).__name__)
+            except OSError as e:
+                self.report_error(folder, e, type(e).__name__)
+
+    def start_progress(self):
+        # El total crece a medida que se descubren archivos
+        self._total = 0
+        self._processed = 0
+        self._last_percent = -1
+        self._last_stats = time.perf_counter()
+
+    def discover(self):
+        self._total += 1
+
+    def record(self, path, st, h, dims):
+        self.state.images.setdefault(h, []).append(path)
+        self.state.entries[path] = (st.st_size, st.st_mtime_ns, st.st_ino, h) + tuple(dims)
+        self.profile.files += 1
+        self._processed += 1
+        percent = int((self._processed / self._total) * 100)
+        if percent != self._last_percent:
+            self._last_percent = percent
+            if self.on_progress:
+                self.on_progress(percent)
+        if self.on_stats:
+            now = time.perf_counter()
+            if now - self._last_stats >= self.STATS_INTERVAL:
+                self._last_stats = now
+                self.on_stats(self.profile.snapshot())
+
+    def _digest(self, entry, partial):
+        # Tras cancelar, las tareas que queden en el pool terminan al instante
+        if not self._isRunning:
+            return None
+        try:
+            return file_digest(entry[0], entry[1].st_size, partial)
+        except OSError as e:
+            self.report_error(entry[0], e, type(e).__name__)
+            return None
+
+    def _split_by_digest(self, groups, partial):
+        # Reparte cada grupo en subgrupos con el mismo digest; los archivos
+        # que no se pudieron leer quedan solos
+        entries = [entry for group in groups for entry in group]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            digests = pool.map(lambda entry: self._digest(entry, partial), entries)
+            buckets = {}
+            singles = []
+            for entry, digest in zip(entries, digests):
+                if digest is None:
+                    singles.append([entry])
+                else:
+                    buckets.setdefault((entry[1].st_size, digest), []).append(entry)
+        return list(buckets.values()) + singles
+
+    def find_exact_duplicates(self, entries):
+        """Separa las copias idénticas byte a byte sin decodificar ningún píxel.
+
+        Los archivos se agrupan por tamaño, luego por un digest de su
+        principio y su final, y por último por un BLAKE2 del contenido
+        completo. Devuelve la lista de archivos que hay que hashear (uno
+        por grupo idéntico) y un diccionario con las copias de cada uno.
+        """
+        by_size = {}
+        for entry in entries:
+            by_size.setdefault(entry[1].st_size, []).append(entry)
+        groups = [group for group in by_size.values() if len(group) > 1]
+        unique = [group[0] for group in by_size.values() if len(group) == 1]
+
+        # Si el archivo es pequeño el digest parcial ya cubrió todo el contenido
+        groups = self._split_by_digest(groups, partial=True)
+        large = [g for g in groups if g[0][1].st_size > 2 * PARTIAL_DIGEST_BYTES]
+        groups = [g for g in groups if g[0][1].st_size <= 2 * PARTIAL_DIGEST_BYTES]
+        groups.extend(self._split_by_digest([g for g in large if len(g) > 1], partial=False))
+        groups.extend(g for g in large if len(g) == 1)
+
+        copies = {}
+        for group in groups:
+            unique.append(group[0])
+            if len(group) > 1:
+                copies[group[0][0]] = group[1:]
+        return unique, copies
+
+    def pending_entries(self, cache, copies):
+        """Genera los archivos que hay que hashear mientras se recorre la carpeta.
+
+        Los que siguen igual que en la caché o en la búsqueda anterior se
+        registran sin leerlos. El
+        primer archivo de cada tamaño se entrega enseguida, así el hash
+        empieza sin esperar al recorrido; los que repiten tamaño esperan
+        al final para pasar por la etapa de copias exactas, que rellena
+        ``copies`` y entrega solo los representantes que faltan.
+        """
+        known = cache.load(self.folder) if cache else {}
+        listing = known
+        manifest = None
+        if self.previous is not None:
+            known.update(self.previous.entries)
+            manifest = self.previous.dirs
+        elif cache:
+            manifest = cache.load_dirs(self.folder)
+            if self.incremental:
+                listing = cache.load_files(self.folder)
+
+        by_size = {}
+        for path, st in self.scan_entries(manifest if self.incremental else None, listing):
+            self.discover()
+            found = HashCache.lookup(known, path, st)
+            if found is not None:
+                self.profile.cached += 1
+                self.record(path, st, *found)
+                continue
+            group = by_size.get(st.st_size)
+            if group is None:
+                by_size[st.st_size] = [(path, st)]
+                yield path, st
+            else:
+                group.append((path, st))
+
+        repeated = [entry for group in by_size.values() if len(group) > 1 for entry in group]
+        unique, found = self.find_exact_duplicates(repeated)
+        copies.update(found)
+        for path, st in unique:
+            if by_size[st.st_size][0][0] != path:
+                yield path, st
+
+    def hash_files(self, entries, cache=None, hashes=None):
+        """Calcula los hashes en un pool de procesos.
+
+        Solo se mantienen ``workers * 4`` tareas en vuelo, así la cola queda
+        acotada aunque la carpeta tenga cientos de miles de imágenes, y el
+        hilo de Qt se limita a recibir resultados y emitir el progreso.
+        Si se pasa ``hashes`` se guarda ahí el hash y las dimensiones de cada ruta.
+
+        Con ``prefetch`` la lectura es una etapa aparte: un pool de hilos
+        mantiene ``prefetch`` lecturas en curso, y lo leído espera en
+        ``ready`` a que haya sitio en los procesos. No se piden más lecturas
+        mientras los bytes en vuelo (en lectura, esperando o en los procesos)
+        lleguen a ``prefetch_bytes``.
+        """
+        max_pending = self.workers * 4
+        entries = iter(entries)
+        pending = {}
+        reading = {}
+        ready = deque()
+        in_flight = 0
+        pool = None
+        reader = None
+
+        def submit(entry, data=None):
+            nonlocal pool
+            if pool is None:
+                # "spawn" evita hacer fork de un proceso con hilos de Qt activos
+                pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"))
+            pending[pool.submit(hash_image, entry[0], self.algorithms, self.dihedral, True, data)] = entry
+
+        try:
+            exhausted = False
+            while self._isRunning:
+                # Rellenar la cola hasta el límite: las lecturas si hay lectura
+                # anticipada y, si no, directamente los procesos
+                while self._isRunning and not exhausted and (
+                        len(reading) < self.prefetch and in_flight < self.prefetch_bytes
+                        if self.prefetch else len(pending) < max_pending):
+                    # El recorrido de carpetas avanza aquí, intercalado con el hash
+                    start = time.perf_counter()
+                    entry = next(entries, None)
+                    self.profile.add_phase("listing", time.perf_counter() - start)
+                    if entry is None:
+                        exhausted = True
+                        break
+                    if self.prefetch:
+                        if reader is None:
+                            reader = concurrent.futures.ThreadPoolExecutor(
+                                max_workers=self.prefetch, thread_name_prefix="prefetch")
+                            self.profile.prefetch = self.prefetch
+                        reading[reader.submit(read_file, entry[0])] = entry
+                        in_flight += entry[1].st_size
+                    else:
+                        submit(entry)
+                while ready and len(pending) < max_pending:
+                    submit(*ready.popleft())
+                if reader is not None:
+                    self.profile.set_queue(len(reading), len(ready), in_flight)
+
+                if not pending and not reading:
+                    break
+
+                done, _ = concurrent.futures.wait(
+                    list(pending) + list(reading), timeout=self.POLL_INTERVAL,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    if future in reading:
+                        entry = reading.pop(future)
+                        try:
+                            data, read_time = future.result()
+                        except OSError as e:
+                            in_flight -= entry[1].st_size
+                            self.report_error(entry[0], e, type(e).__name__)
+                            continue
+                        self.profile.add_read(read_time)
+                        ready.append((entry, data))
+                        continue
+                    entry = pending.pop(future)
+                    if reader is not None:
+                        in_flight -= entry[1].st_size
+                    path, h, dims, error, error_type, decode_time, hash_time = future.result()
+                    if error is not None:
+                        self.report_error(path, error, error_type)
+                        continue
+                    self.profile.add_hashed(path, entry[1].st_size, decode_time, hash_time)
+                    if cache:
+                        cache.store(path, entry[1], h, dims)
+                    if hashes is not None:
+                        hashes[path] = h, dims
+                    self.record(path, entry[1], h, dims)
+        finally:
+            # Descartar lo que quede en cola y no esperar a los procesos:
+            # como mucho terminan la imagen que tienen entre manos
+            for future in pending:
+                future.cancel()
+            if pool is not None:
+                pool.shutdown(wait=not pending)
+            if reader is not None:
+                # Las lecturas en curso terminan solas; las de la cola se descartan
+                for future in reading:
+                    future.cancel()
+                reader.shutdown(wait=False)
+            if cache:
+                cache.flush()
+
+    def similar_pairs(self, values, radius):
+        """Genera en bloques de arrays los pares (i, j) de ``values`` a distancia <= ``radius``.
+
+        Los pares salen del primer hash de cada firma (al sondear, con las
+        orientaciones de los dos, como en ``probe_distance``); con
+        verificación solo se entregan los que confirma ``confirm``.
+        """
+        for ii, jj, _ in self.close_pairs(self.hash_matrix(values), radius):
+            yield self.confirm_pairs(values, values, ii, jj)
+
+    def confirm_pairs(self, a, b, ii, jj):
+        # Filtra los pares (a[i], b[j]) con ``confirm``; sin verificación
+        # todos pasan y basta con contarlos
+        if not self.verify:
+            self.candidate_pairs += len(ii)
+            self.confirmed_pairs += len(ii)
+            return ii, jj
+        keep = np.fromiter((self.confirm(a[i], b[j]) for i, j in zip(ii.tolist(), jj.tolist())),
+                           dtype=bool, count=len(ii))
+        return ii[keep], jj[keep]
+
+    def hash_matrix(self, values):
+        """Array uint64 (firmas x orientaciones) del primer hash; la columna 0 es el hash sin girar."""
+        if self.probes > 1:
+            rows = [v[:self.probes] for v in values]
+        else:
+            rows = [(primary_hash(v),) for v in values]
+        return np.array(rows, dtype=np.uint64).reshape(len(values), self.probes)
+
+    def probe_distance(self, a, b):
+        """Distancia del primer hash de ``a`` y ``b``.
+
+        Al sondear es la menor entre las orientaciones de cada uno y el otro
+        sin girar, en las dos direcciones: no depende del orden del par.
+        """
+        if self.probes == 1:
+            return hamming(primary_hash(a), primary_hash(b))
+        return min(min(hamming(a[t], b[0]), hamming(b[t], a[0])) for t in range(self.probes))
+
+    def best_transform(self, a, b):
+        # Orientación que mejor alinea el par y a cuál de los dos se aplica
+        _, t, swapped = min(min((hamming(a[t], b[0]), t, False) for t in range(self.probes)),
+                            min((hamming(b[t], a[0]), t, True) for t in range(self.probes)))
+        return t, swapped
+
+    def confirm(self, a, b):
+        """Segunda etapa de la cascada: decide si un par candidato se agrupa."""
+        self.candidate_pairs += 1
+        if not self.verify:
+            self.confirmed_pairs += 1
+            return True
+        ok = self.pair_verify_distance(a, b) <= self.verify_radius
+        if ok:
+            self.confirmed_pairs += 1
+        return ok
+
+    def pair_verify_distance(self, a, b):
+        # El valor de verificación va tras las orientaciones del primer hash
+        t = 0
+        if self.probes > 1:
+            # Con el par ordenado, los empates de ``best_transform`` no
+            # dependen de cuál de los dos llega primero
+            if b < a:
+                a, b = b, a
+            t, swapped = self.best_transform(a, b)
+            if swapped:
+                a, b = b, a
+        return self.verify_distance(a[self.probes + t], b[self.probes])
+
+    def verify_distance(self, va, vb):
+        if self.verify == "pixels":
+            size = PIXEL_SIDE * PIXEL_SIDE
+            pa = np.frombuffer(va.to_bytes(size, "big"), dtype=np.uint8)
+            pb = np.frombuffer(vb.to_bytes(size, "big"), dtype=np.uint8)
+            return np.abs(pa.astype(np.int16) - pb).mean()
+        return hamming(va, vb)
+
+    def level_radii(self):
+        # Radios de cada umbral de 0 a ``max_threshold``, para ``linkage``
+        levels = range(self.max_threshold + 1)
+        radii = np.array([self.radius_for(t) for t in levels])
+        verify_radii = np.array([self.verify_radius_for(t) for t in levels]) if self.verify else None
+        return radii, verify_radii
+
+    def verify_distances(self, a, b, ii, jj):
+        """Distancia de verificación de cada par (a[i], b[j]), como ``pair_verify_distance``.
+
+        Con un hash de verificación y sin orientaciones se calcula con NumPy;
+        con píxeles u orientaciones, par a par.
+        """
+        if self.probes == 1 and self.verify != "pixels":
+            va = np.array([v[1] for v in a], dtype=np.uint64)
+            vb = va if b is a else np.array([v[1] for v in b], dtype=np.uint64)
+            return popcount64(va[ii] ^ vb[jj])
+        return np.fromiter((self.pair_verify_distance(a[i], b[j])
+                            for i, j in zip(ii.tolist(), jj.tolist())),
+                           dtype=np.float64, count=len(ii))
+
+    def level_edges(self, a, radii, verify_radii, b=None):
+        """Genera en bloques las aristas de ``linkage``: arrays ``(i, j, umbral)``.
+
+        Sin ``b`` son los pares de ``a``; con ``b``, los de ``a`` x ``b``. Los
+        pares se buscan una sola vez con el mayor radio y el umbral de cada
+        uno sale de su distancia con ``searchsorted``: el menor con el que es
+        candidato y, con verificación, con el que además se confirma. Los
+        pares que no se agrupan en ningún umbral no salen.
+        """
+        levels = len(radii)
+        other = a if b is None else b
+        if not len(a) or not len(other):
+            return
+        blocks = self.close_pairs(self.hash_matrix(a), radii[-1],
+                                  None if b is None else self.hash_matrix(b))
+        for ii, jj, d in blocks:
+            candidate = np.searchsorted(radii, d, "left")
+            level = candidate
+            if self.verify:
+                vd = self.verify_distances(a, other, ii, jj)
+                level = np.maximum(candidate, np.searchsorted(verify_radii, vd, "left"))
+            self.candidate_pairs += int(np.count_nonzero(candidate <= self.threshold))
+            self.confirmed_pairs += int(np.count_nonzero(level <= self.threshold))
+            keep = level < levels
+            yield ii[keep], jj[keep], level[keep].astype(np.int8)
+
+    def link_levels(self, labels, blocks):
+        """Une en ``labels`` (umbrales x hashes) las aristas ``(i, j, umbral)`` de ``blocks``.
+
+        Cada fila recibe las aristas de su umbral y de los menores. Se unen
+        por tandas de ``LINK_CHUNK`` a medida que llegan, así que la memoria
+        depende del número de hashes y no del de pares.
+        """
+        pending, count = [], 0
+        for block in blocks:
+            pending.append(block)
+            count += len(block[0])
+            if count >= self.LINK_CHUNK:
+                self.merge_levels(labels, pending)
+                pending, count = [], 0
+        self.merge_levels(labels, pending)
+
+    @staticmethod
+    def merge_levels(labels, blocks):
+        if not blocks:
+            return
+        first = np.concatenate([i for i, _, _ in blocks])
+        second = np.concatenate([j for _, j, _ in blocks])
+        level = np.concatenate([t for _, _, t in blocks])
+        for t in range(len(labels)):
+            edges = level <= t
+            ra, rb = labels[t][first[edges]], labels[t][second[edges]]
+            # Las aristas dentro de un mismo grupo ya no cambian nada
+            apart = ra != rb
+            labels[t] = merge_labels(labels[t], ra[apart], rb[apart])
+
+    def linkage(self, hashes):
+        """Grupos de ``hashes`` en cada umbral de 0 a ``max_threshold``.
+
+        Cada par recibe de ``level_edges`` el menor umbral con el que se
+        agrupa y se une en ese umbral y en los mayores: la agrupación es
+        por enlace simple. Devuelve un array (umbrales x hashes) con la
+        etiqueta de cada hash: el menor índice de su grupo.
+        """
+        radii, verify_radii = self.level_radii()
+        labels = np.tile(np.arange(len(hashes), dtype=np.int32), (len(radii), 1))
+        self.link_levels(labels, self.level_edges(hashes, radii, verify_radii))
+        return labels
+
+    def close_pairs(self, a, radius, b=None):
+        """Genera bloques ``(i, j, d)`` de pares a distancia ``d <= radius``.
+
+        ``a`` y ``b`` son matrices de ``hash_matrix``. Sin ``b`` son los pares
+        ``i < j`` de ``a``; con ``b``, los de ``a`` x ``b``. Cada par sale una
+        sola vez, con la distancia de ``probe_distance``. Con
+        ``grouping="bands"`` se buscan por bandas si ``band_count`` estima
+        que sale más barato; si no, por bloques de NumPy.
+        """
+        if not len(a) or (b is not None and not len(b)):
+            return
+        count = None
+        if self.grouping == "bands":
+            count = self.band_count(len(a), len(a) if b is None else len(b), radius, b is None)
+        if count is not None:
+            yield from self.band_pairs(a, radius, b, count)
+        else:
+            yield from self.tile_pairs(a, radius, b)
+
+    def matrix_distances(self, a, b):
+        # Distancia fila a fila entre dos matrices de ``hash_matrix``
+        d = popcount64(a[:, 0] ^ b[:, 0])
+        for t in range(1, a.shape[1]):
+            d = np.minimum(d, np.minimum(popcount64(a[:, t] ^ b[:, 0]), popcount64(a[:, 0] ^ b[:, t])))
+        return d
+
+    def tile_pairs(self, a, radius, b=None):
+        # Recorre la matriz de distancias por bloques: XOR y conteo de bits
+        # vectorizados, con memoria acotada por TILE_SIZE y comprobando la
+        # cancelación entre bloque y bloque. Sin ``b`` basta con el triángulo
+        # superior. Las orientaciones se recorren de una en una para no
+        # multiplicar por 8 la memoria del bloque
+        other = a if b is None else b
+        tile = self.TILE_SIZE
+        for row in range(0, len(a), tile):
+            rows = a[row:row + tile]
+            for col in range(row if b is None else 0, len(other), tile):
+                if not self._isRunning:
+                    return
+                cols = other[col:col + tile]
+                self.comparisons += len(rows) * len(cols) * (2 * self.probes - 1)
+                d = popcount64(rows[:, None, 0] ^ cols[None, :, 0])
+                for t in range(1, self.probes):
+                    d = np.minimum(d, popcount64(rows[:, None, t] ^ cols[None, :, 0]))
+                    d = np.minimum(d, popcount64(rows[:, None, 0] ^ cols[None, :, t]))
+                close = d <= radius
+                if b is None and col == row:
+                    close = np.triu(close, k=1)
+                ii, jj = np.nonzero(close)
+                yield ii + row, jj + col, d[ii, jj]
+
+    def band_passes(self, na, nb, single):
+        # (consultas, tamaño de la base, dirección) de cada pasada de ``band_pairs``:
+        # cada orientación de un lado consulta el otro sin girar. Sin
+        # orientaciones entre dos conjuntos basta una, y consulta el menor
+        if single:
+            return [(na * self.probes, na, 0)]
+        if self.probes > 1:
+            return [(na * self.probes, nb, 0), (nb * self.probes, na, 1)]
+        return [(na, nb, 0)] if na <= nb else [(nb, na, 1)]
+
+    def band_count(self, na, nb, radius, single):
+        """Número de bandas con el que ``band_pairs`` sale más barato, o ``None`` si no compensa.
+
+        Con ``m`` bandas, dos hashes a distancia <= ``radius`` difieren en
+        ``radius // m`` bits como mucho en alguna banda. Cada consulta
+        recorre esas claves vecinas en cada banda y compara los candidatos
+        que encuentra; el coste se estima suponiendo hashes uniformes y se
+        compara con el de recorrer la matriz por bloques.
+        """
+        bits = HASH_BITS.get(self.algorithms[0], 64)
+        tiles = na * nb * (2 * self.probes - 1) / (2 if single else 1)
+        best = None
+        for count in range(1, min(radius + 1, bits) + 1):
+            width = bits // count
+            neighbours = sum(math.comb(width, k) for k in range(radius // count + 1))
+            lookup = self.BAND_LOOKUP_COST
+            if width > self.BAND_TABLE_BITS:
+                lookup *= max(1, math.log2(max(na, nb)) / 4)
+            cost = sum(queries * count * neighbours
+                       * (lookup + self.BAND_CANDIDATE_COST * base / 2 ** width)
+                       for queries, base, _ in self.band_passes(na, nb, single))
+            if best is None or cost < best[0]:
+                best = cost, count
+        return best[1] if best is not None and best[0] < tiles else None
+
+    def band_pairs(self, a, radius, b=None, count=None):
+        """Pares a distancia <= ``radius`` por índices de bandas (multi-index hashing).
+
+        El hash se parte en ``count`` bandas y se indexa, banda a banda, la
+        orientación sin girar del lado consultado; si dos hashes están a
+        ``radius`` bits o menos, en alguna banda difieren en ``radius //
+        count`` como mucho. Cada orientación del otro lado busca en cada
+        banda las claves a esa distancia, y solo los candidatos se comparan
+        enteros. Un par que aparece por varias bandas u orientaciones se
+        entrega solo desde la primera, así que cada uno sale una vez sin
+        guardar los ya vistos.
+        """
+        bits = HASH_BITS.get(self.algorithms[0], 64)
+        count = count or radius + 1
+        bands = hash_bands(bits, count)
+        sub = radius // count
+        single = b is None
+        if single:
+            b = a
+        passes = self.band_passes(len(a), len(b), single)
+        # Con un solo conjunto cada par se consulta desde sus dos hashes
+        directions = [0, 1] if single else [direction for _, _, direction in passes]
+        for _, _, direction in passes:
+            queries, base = (a, b) if direction == 0 else (b, a)
+            flat = queries.ravel()
+            upright = base[:, 0]
+            for band, (shift, width) in enumerate(bands):
+                mask = np.uint64((1 << width) - 1)
+                # Las claves de las bandas estrechas van como índices de la tabla
+                dtype = np.int64 if width <= self.BAND_TABLE_BITS else np.uint64
+                keys = ((upright >> np.uint64(shift)) & mask).astype(dtype)
+                order = np.argsort(keys, kind="stable")
+                if dtype is np.int64:
+                    sizes = np.bincount(keys, minlength=1 << width)
+                    starts = np.cumsum(sizes) - sizes
+                else:
+                    sorted_keys = keys[order]
+                masks = flip_masks(width, sub).astype(dtype)
+                query_keys = ((flat >> np.uint64(shift)) & mask).astype(dtype)
+                step = max(1, self.BAND_CHUNK // len(masks))
+                for start in range(0, len(flat), step):
+                    if not self._isRunning:
+                        return
+                    near = (query_keys[start:start + step, None] ^ masks[None, :]).ravel()
+                    if dtype is np.int64:
+                        left = starts[near]
+                        counts = sizes[near]
+                    else:
+                        left = np.searchsorted(sorted_keys, near, "left")
+                        counts = np.searchsorted(sorted_keys, near, "right") - left
+                    hit = np.flatnonzero(counts)
+                    owners = start + hit // len(masks)
+                    for qi, bi in self.expand_runs(owners, left[hit], counts[hit], order):
+                        self.comparisons += len(qi)
+                        keep = popcount64(flat[qi] ^ upright[bi]) <= radius
+                        qi, bi = qi[keep], bi[keep]
+                        qi, transform = qi // self.probes, qi % self.probes
+                        if single:
+                            keep = qi != bi
+                            qi, bi, transform = qi[keep], bi[keep], transform[keep]
+                            # El par va como (menor, mayor); consultó el mayor si qi > bi
+                            side = (qi > bi).astype(np.int64)
+                            ii, jj = np.minimum(qi, bi), np.maximum(qi, bi)
+                        else:
+                            side = np.full(len(qi), direction, dtype=np.int64)
+                            ii, jj = (qi, bi) if direction == 0 else (bi, qi)
+                        finder = (side * self.probes + transform) * count + band
+                        keep = self.first_finder(a, b, ii, jj, bands, sub, radius, directions) == finder
+                        ii, jj = ii[keep], jj[keep]
+                        if len(ii):
+                            yield ii, jj, self.matrix_distances(a[ii], b[jj])
+
+    def first_finder(self, a, b, ii, jj, bands, sub, radius, directions):
+        # Primera (dirección, orientación, banda) por la que ``band_pairs``
+        # encuentra cada par (a[i], b[j]), numerada como allí
+        first = np.full(len(ii), 2 * self.probes * len(bands), dtype=np.int64)
+        for direction in directions:
+            for t in range(self.probes):
+                if direction == 0:
+                    x = a[ii, t] ^ b[jj, 0]
+                else:
+                    x = b[jj, t] ^ a[ii, 0]
+                close = popcount64(x) <= radius
+                for band, (shift, width) in enumerate(bands):
+                    part = (x >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+                    found = close & (popcount64(part) <= sub)
+                    position = (direction * self.probes + t) * len(bands) + band
+                    first = np.where(found, np.minimum(first, position), first)
+        return first
+
+    def expand_runs(self, owners, starts, counts, order):
+        # Pares (dueño, posición en la base) de los tramos ``starts[k]`` a
+        # ``starts[k] + counts[k]`` de la base ordenada por ``order``, en
+        # bloques de unos BAND_CHUNK pares para acotar la memoria
+        ends = np.cumsum(counts)
+        start = 0
+        while start < len(owners):
+            stop = max(start + 1, int(np.searchsorted(ends, ends[start] - counts[start] + self.BAND_CHUNK,
+                                                      "right")))
+            c = counts[start:stop]
+            total = int(c.sum())
+            offsets = np.arange(total) - np.repeat(np.cumsum(c) - c, c)
+            yield np.repeat(owners[start:stop], c), order[np.repeat(starts[start:stop], c) + offsets]
+            start = stop
+
+    def cross_pairs(self, reference, candidates, radius):
+        """Genera en bloques de arrays los pares (i, j) entre ``reference`` y ``candidates``.
+
+        Como ``similar_pairs``, pero solo entre los dos conjuntos: nunca se
+        comparan dos valores del mismo.
+        """
+        if not reference or not candidates:
+            return
+        blocks = self.close_pairs(self.hash_matrix(reference), radius, self.hash_matrix(candidates))
+        for ii, jj, _ in blocks:
+            yield self.confirm_pairs(reference, candidates, ii, jj)
+
+    def components(self, hashes):
+        """Agrupa ``hashes`` en componentes conexas de hashes similares."""
+        first, second = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for ii, jj in self.similar_pairs(hashes, self.radius):
+            first.append(ii)
+            second.append(jj)
+        labels = merge_labels(np.arange(len(hashes)), np.concatenate(first), np.concatenate(second))
+        groups = {}
+        for h, label in zip(hashes, labels.tolist()):
+            groups.setdefault(label, []).append(h)
+        return list(groups.values())
+
+    def group_all(self):
+        if self.max_threshold is not None:
+            keys = list(self.state.images)
+            labels = self.linkage(keys)
+            if not self._isRunning:
+                return
+            self.set_linkage(keys, labels)
+            return
+        for members in self.components(list(self.state.images)):
+            if not self._isRunning:
+                return
+            self.state.new_group(members)
+
+    def set_linkage(self, keys, labels):
+        self.state.linkage = labels
+        self.state.linkage_keys = keys
+        self.state.radii = [self.radius_for(t) for t in range(len(labels))]
+        self.state.set_labels(labels[self.threshold])
+
+    def split_linkage(self, keys, labels, gone):
+        """Quita de ``labels`` las columnas de los hashes ``gone`` y parte los grupos que haga falta.
+
+        Los grupos de cada umbral están dentro de los del mayor, así que
+        basta con recalcular ``linkage`` para lo que queda de los grupos del
+        mayor umbral que contenían hashes quitados. Devuelve ``(keys, labels)``.
+        """
+        if not gone:
+            return keys, labels
+        keep = np.fromiter((h not in gone for h in keys), dtype=bool, count=len(keys))
+        top = labels[-1]
+        touched = np.isin(top, top[~keep])[keep]
+        keys = [h for h, k in zip(keys, keep.tolist()) if k]
+        labels = keep_columns(labels, keep)
+        top = labels[-1]
+        for label in np.unique(top[touched]).tolist():
+            if not self._isRunning:
+                break
+            members = np.flatnonzero(top == label)
+            sub = self.linkage([keys[i] for i in members.tolist()])
+            # ``members`` está ordenado: el menor índice local es el menor global
+            labels[:, members] = members[sub]
+        return keys, labels
+
+    def split_groups(self, gone):
+        # Quitar hashes solo puede partir grupos: se reagrupa lo que queda de los afectados
+        state = self.state
+        affected = set()
+        for h in gone:
+            gid = state.group_of.pop(h)
+            state.groups[gid].discard(h)
+            affected.add(gid)
+        for gid in affected:
+            for members in self.components(list(state.groups.pop(gid))):
+                state.new_group(members)
+
+    def discard(self, state, paths):
+        """Quita ``paths`` de ``state`` sin repetir la búsqueda: borrados, movidos o enlazados.
+
+        Los grupos que contenían los hashes que se quedan sin archivos se
+        parten donde haga falta, en todos los umbrales si ``state`` tiene
+        ``linkage`` (con los umbrales de ``state``; sin ``linkage``, con el
+        radio de este ``Scanner``).
+        """
+        gone = state.discard(paths)
+        if not gone:
+            return
+        self.state = state
+        if state.linkage is None:
+            self.split_groups(gone)
+            return
+        self.max_threshold = len(state.linkage) - 1
+        state.linkage_keys, state.linkage = self.split_linkage(state.linkage_keys, state.linkage, gone)
+        state.set_labels(state.linkage[state.radii.index(state.radius)])
+
+    def update_linkage(self, previous):
+        """Como ``update_groups``, pero con los grupos de todos los umbrales de ``linkage``.
+
+        Los grupos de cada umbral están dentro de los del mayor, así que al
+        quitar hashes basta con recalcular ``linkage`` para lo que queda de
+        los grupos del mayor umbral que los contenían. Los hashes nuevos se
+        añaden como columnas y en cada umbral se unen con sus pares.
+        """
+        state = self.state
+        radii, verify_radii = self.level_radii()
+        levels = len(radii)
+        keys, labels = self.split_linkage(previous.linkage_keys, previous.linkage[:levels],
+                                          previous.images.keys() - state.images.keys())
+        if not self._isRunning:
+            return
+
+        old = len(keys)
+        new = [h for h in state.images if h not in previous.images]
+        fresh = np.arange(old, old + len(new), dtype=labels.dtype)
+        labels = np.concatenate([labels, np.broadcast_to(fresh, (levels, len(new)))], axis=1)
+        # Los hashes nuevos van después de los que ya estaban
+        self.link_levels(labels, (
+            (ii + old, jj + offset, level)
+            for offset, pairs in ((old, self.level_edges(new, radii, verify_radii)),
+                                  (0, self.level_edges(new, radii, verify_radii, keys)))
+            for ii, jj, level in pairs))
+        if not self._isRunning:
+            return
+        self.set_linkage(keys + new, labels)
+
+    def update_groups(self, previous):
+        """Actualiza los grupos de la búsqueda anterior en vez de recalcularlos.
+
+        Quitar hashes solo puede partir grupos, así que basta con reagrupar
+        lo que queda de los grupos afectados; un hash nuevo solo puede unir
+        grupos, así que solo se buscan los pares de los hashes nuevos (entre
+        ellos y con los que ya estaban) y se fusionan los grupos que toque.
+        """
+        state = self.state
+        state.group_of = dict(previous.group_of)
+        state.groups = {gid: set(members) for gid, members in previous.groups.items()}
+        state._next_group = previous._next_group
+
+        self.split_groups(previous.images.keys() - state.images.keys())
+
+        new = [h for h in state.images if h not in previous.images]
+        old = [h for h in state.images if h in previous.images]
+        for h in new:
+            state.new_group([h])
+        for a, b, pairs in ((new, new, self.similar_pairs(new, self.radius)),
+                            (new, old, self.cross_pairs(new, old, self.radius))):
+            for ii, jj in pairs:
+                if not self._isRunning:
+                    return
+                for i, j in zip(ii.tolist(), jj.tolist()):
+                    state.merge_groups(state.group_of[a[i]], state.group_of[b[j]])
+
+    def hash_all(self, profile=None):
+        """Lista la carpeta y calcula los hashes que falten, sin agrupar.
+
+        Deja en ``state`` las entradas de todos los archivos. Devuelve
+        ``False`` si se canceló con ``stop``. Con ``profile`` las métricas se
+        suman a ese ``ScanProfile`` en lugar de empezar uno nuevo.
+        """
+        self.profile = profile or ScanProfile()
+        self.start_progress()
+        self.state = ScanState(self.folder, self.exclude_subfolders, self.radius, self.hash_key)
+        copies = {}
+        hashes = {}
+        cache = self.open_cache()
+        try:
+            start = time.perf_counter()
+            listed = self.profile.phases.get("listing", 0.0)
+            self.hash_files(self.pending_entries(cache, copies), cache, hashes)
+            # "listing" (recorrido, caché y copias exactas) ya se contó dentro
+            self.profile.add_phase("hashing", time.perf_counter() - start
+                                   - (self.profile.phases.get("listing", 0.0) - listed))
+            # Las copias exactas heredan el hash y las dimensiones de su representante
+            for rep_path, group in copies.items():
+                found = hashes.get(rep_path)
+                if found is None:
+                    continue
+                for path, st in group:
+                    if cache:
+                        cache.store(path, st, *found)
+                    self.record(path, st, *found)
+                    self.profile.copies += 1
+            if self._isRunning:
+                self.state.dirs = self.dirs
+                if cache:
+                    with self.profile.phase("cache"):
+                        # Olvidar las imágenes que ya no existen en la carpeta
+                        cache.prune(self.folder, self.state.entries,
+                                    recursive=not self.exclude_subfolders)
+                        cache.store_dirs(self.folder, self.dirs,
+                                         recursive=not self.exclude_subfolders)
+        finally:
+            if cache:
+                cache.close()
+        return self._isRunning
+
+    def run(self):
+        self.candidate_pairs = 0
+        self.confirmed_pairs = 0
+        self.comparisons = 0
+        # Si la búsqueda fue cancelada, no continuar con el procesamiento
+        if not self.hash_all():
+            self.state = None
+            return None
+        
+        with self.profile.phase("grouping"):
+            previous = self.previous
+            if self.max_threshold is not None:
+                # Se actualizan los grupos de todos los umbrales si la búsqueda
+                # anterior los guardó; si no, se calculan de nuevo
+                if (previous is not None and previous.linkage is not None
+                        and len(previous.linkage) > self.max_threshold):
+                    self.update_linkage(previous)
+                else:
+                    self.group_all()
+            elif previous is not None and previous.radius == self.radius:
+                self.update_groups(previous)
+            else:
+                self.group_all()
+        self.profile.comparisons = self.comparisons
+        self.profile.candidate_pairs = self.candidate_pairs
+        self.profile.confirmed_pairs = self.confirmed_pairs
+        
+        # Si la búsqueda fue cancelada, no continuar con el procesamiento
+        if not self._isRunning:
+            self.state = None
+            return None
+        
+        if self.on_stats:
+            self.on_stats(self.profile.snapshot())
+        return self.state.duplicates()
+
+    def regroup(self):
+        """Agrupa de nuevo los hashes de ``previous`` con el umbral de este ``Scanner``.
+
+        No lee ningún archivo: sirve para cambiar de umbral fuera del rango
+        que guardó la búsqueda anterior. Devuelve lo mismo que ``run``.
+        """
+        if self.previous is None:
+            raise ValueError("No hay una búsqueda anterior que reagrupar")
+        self.profile = ScanProfile()
+        self.candidate_pairs = 0
+        self.confirmed_pairs = 0
+        self.comparisons = 0
+        previous = self.previous
+        self.state = ScanState(self.folder, self.exclude_subfolders, self.radius, self.hash_key)
+        self.state.images = previous.images
+        self.state.entries = previous.entries
+        self.state.dirs = previous.dirs
+        self.profile.files = len(previous.entries)
+        self.profile.cached = len(previous.entries)
+        with self.profile.phase("grouping"):
+            self.group_all()
+        self.profile.comparisons = self.comparisons
+        self.profile.candidate_pairs = self.candidate_pairs
+        self.profile.confirmed_pairs = self.confirmed_pairs
+        if not self._isRunning:
+            self.state = None
+            return None
+        if self.on_stats:
+            self.on_stats(self.profile.snapshot())
+        return self.state.duplicates()
+
+    def stop(self):
+        self._isRunning = False
+
+class SetComparison:
+    """Compara conjuntos de carpetas: solo busca los candidatos entre las referencias.
+
+    ``roots`` es una lista de ``(carpeta, rol)`` con rol ``"reference"`` o
+    ``"candidate"``. Cada carpeta se hashea con su propio ``Scanner`` (con
+    la caché de siempre) y solo se buscan los pares entre conjuntos: los de
+    dentro de uno no se calculan nunca. Si las bandas filtran el radio
+    (``Scanner.band_count``) se indexa un lado (sin orientaciones, el mayor)
+    y el otro lo consulta; con radios grandes, como el del umbral
+    predeterminado, se recorren con NumPy todos los bloques candidatos x
+    referencias, así que el coste crece con |A|·|B|.
+    Los grupos son las componentes de los pares entre conjuntos, con las
+    referencias primero. ``run`` devuelve ``{hash: [rutas]}`` como
+    ``Scanner.run`` (o ``None`` si se canceló) y ``roles`` dice de qué lado
+    es cada ruta; si una ruta está en dos carpetas se queda con el primer rol.
+    """
+
+    def __init__(self, roots, threshold, exclude_subfolders=False, progress=None, **options):
+        roles = {role for _, role in roots}
+        unknown = roles - set(ROLES)
+        if unknown:
+            raise ValueError(f"Rol desconocido: {', '.join(sorted(unknown))}")
+        if roles != set(ROLES):
+            raise ValueError("Hacen falta carpetas de referencia y candidatas")
+        self.roots = list(roots)
+        self.on_progress = progress
+        self.scanners = [Scanner(folder, threshold, exclude_subfolders,
+                                 progress=self.root_progress(k), **options)
+                         for k, (folder, _) in enumerate(self.roots)]
+        # El primero compara: tiene el radio, la verificación y los contadores
+        self.matcher = self.scanners[0]
+        self.roles = {}
+        self.entries = {}
+        self.groups = []
+        self._isRunning = True
+
+    @property
+    def is_running(self):
+        return self._isRunning
+
+    @property
+    def verify(self):
+        return self.matcher.verify
+
+    @property
+    def candidate_pairs(self):
+        return self.matcher.candidate_pairs
+
+    @property
+    def confirmed_pairs(self):
+        return self.matcher.confirmed_pairs
+
+    @property
+    def profile(self):
+        return self.matcher.profile
+
+    def root_progress(self, k):
+        # Cada carpeta ocupa su parte de la barra de progreso
+        def report(percent):
+            if self.on_progress:
+                self.on_progress((k * 100 + percent) // len(self.roots))
+        return report
+
+    def run(self):
+        by_hash = {role: {} for role in ROLES}
+        # Un solo perfil para todas las carpetas, y para la agrupación
+        profile = ScanProfile()
+        for scanner, (_, role) in zip(self.scanners, self.roots):
+            if not self._isRunning or not scanner.hash_all(profile):
+                return None
+            for path, entry in scanner.state.entries.items():
+                if path in self.roles:
+                    continue
+                self.roles[path] = role
+                self.entries[path] = entry
+                by_hash[role].setdefault(entry[3], []).append(path)
+        reference = list(by_hash["reference"])
+        candidates = list(by_hash["candidate"])
+        matcher = self.matcher
+        with matcher.profile.phase("grouping"):
+            pairs = list(matcher.cross_pairs(reference, candidates, matcher.radius))
+            if not self._isRunning:
+                return None
+            # Referencias 0..n-1 y candidatos n.. como nodos de un mismo grafo
+            n = len(reference)
+            a = np.concatenate([np.zeros(0, dtype=np.int64)] + [ii for ii, _ in pairs])
+            b = np.concatenate([np.zeros(0, dtype=np.int64)] + [jj for _, jj in pairs]) + n
+            labels = merge_labels(np.arange(n + len(candidates)), a, b)
+            members = {}
+            for node in np.unique(np.concatenate([a, b])).tolist():
+                members.setdefault(int(labels[node]), []).append(node)
+        matcher.profile.comparisons = matcher.comparisons
+        matcher.profile.candidate_pairs = matcher.candidate_pairs
+        matcher.profile.confirmed_pairs = matcher.confirmed_pairs
+        self.groups = []
+        for nodes in members.values():
+            paths = sorted(p for node in nodes if node < n for p in by_hash["reference"][reference[node]])
+            paths += sorted(p for node in nodes if node >= n for p in by_hash["candidate"][candidates[node - n]])
+            self.groups.append((reference[nodes[0]], paths))
+        return dict(self.groups)
+
+    def results(self):
+        """Los grupos como ``ResultStore``, con el rol de cada archivo."""
+        return ResultStore.from_groups(
+            ([(primary_hash(self.entries[path][3]), path) for path in paths]
+             for _, paths in self.groups),
+            self.entries, self.roles)
+
+    def stop(self):
+        self._isRunning = False
+        for scanner in self.scanners:
+            scanner.stop()
+
+def write_json(duplicates, out, roles=None):
+    if roles is None:
+        groups = [{"hash": hash_to_hex(primary_hash(h)), "files": files}
+                  for h, files in duplicates.items()]
+    else:
+        # Al comparar conjuntos, los archivos de cada grupo van separados por rol
+        groups = [dict({"hash": hash_to_hex(primary_hash(h))},
+                       **{role: [path for path in files if roles[path] == role] for role in ROLES})
+                  for h, files in duplicates.items()]
+    json.dump({"groups": groups}, out, ensure_ascii=False, indent=2)
+    out.write("\n")
+
+def write_csv(duplicates, out, roles=None):
+    writer = csv.writer(out)
+    writer.writerow(["group", "hash", "path"] + (["role"] if roles is not None else []))
+    for group, (h, files) in enumerate(duplicates.items(), 1):
+        for path in files:
+            writer.writerow([group, hash_to_hex(primary_hash(h)), path]
+                            + ([roles[path]] if roles is not None else []))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m escaner",
+        description="Busca imágenes duplicadas en una carpeta sin abrir la interfaz gráfica.")
+    parser.add_argument("folder", nargs="?", help="carpeta a analizar")
+    parser.add_argument("--reference", action="append", metavar="CARPETA",
+                        help="comparar conjuntos: carpeta de referencia (se puede repetir); "
+                             "solo se buscan las imágenes de --candidate que ya están aquí")
+    parser.add_argument("--candidate", action="append", metavar="CARPETA",
+                        help="comparar conjuntos: carpeta que se busca en las de referencia "
+                             "(se puede repetir)")
+    parser.add_argument("--threshold", type=int, default=5,
+                        help="tolerancia de 0 (exacto) a 20 (muy permisivo); "
+                             "equivale a 20 menos el nivel de similitud de la interfaz (por defecto 5)")
+    parser.add_argument("--exclude-subfolders", action="store_true",
+                        help="analizar solo la carpeta principal")
+    parser.add_argument("--format", choices=("json", "csv"), default="json",
+                        help="formato de salida (por defecto json)")
+    parser.add_argument("-o", "--output", help="archivo de salida (por defecto la salida estándar)")
+    parser.add_argument("--grouping", choices=Scanner.GROUPING_BACKENDS, default="bands",
+                        help="motor de agrupación de hashes similares")
+    parser.add_argument("--algorithm", choices=tuple(HASH_ALGORITHMS), default="phash",
+                        help="hash perceptual con el que se buscan candidatos (por defecto phash)")
+    parser.add_argument("--verify", choices=VERIFY_METHODS,
+                        help="segundo hash, o \"pixels\", que confirma cada par candidato")
+    parser.add_argument("--dihedral", choices=DIHEDRAL_MODES,
+                        help="detectar también copias giradas o en espejo: \"canonical\" compara "
+                             "la orientación con menor hash, \"probe\" prueba las 8 orientaciones")
+    parser.add_argument("--workers", type=int, help="procesos para calcular hashes")
+    parser.add_argument("--prefetch", type=int, default=0, metavar="N",
+                        help="lecturas anticipadas en vuelo, para unidades de red (por defecto 0: "
+                             "cada proceso lee su imagen)")
+    parser.add_argument("--prefetch-mb", type=int, metavar="MB",
+                        help=f"memoria máxima de lo leído por adelantado "
+                             f"(por defecto {Scanner.PREFETCH_BYTES // 2 ** 20})")
+    parser.add_argument("--incremental", action="store_true",
+                        help="no volver a listar las carpetas que no cambiaron desde la última búsqueda")
+    parser.add_argument("--no-cache", action="store_true", help="no usar la caché de hashes")
+    parser.add_argument("--cache-path", help="ruta del archivo de caché de hashes")
+    parser.add_argument("--profile", metavar="ARCHIVO",
+                        help="guardar en JSON las métricas de la búsqueda: tiempos por fase, "
+                             "rendimiento, formatos, archivos más lentos y errores")
+    parser.add_argument("--profiler", choices=PROFILERS,
+                        help="perfilar el proceso principal con cProfile o pyinstrument")
+    parser.add_argument("--profiler-output", metavar="ARCHIVO",
+                        help="archivo para el informe del perfilador (por defecto stderr)")
+    args = parser.parse_args(argv)
+
+    cross = bool(args.reference or args.candidate)
+    if cross:
+        if args.folder:
+            parser.error("la carpeta no se indica al comparar con --reference y --candidate")
+        if not args.reference or not args.candidate:
+            parser.error("comparar conjuntos necesita --reference y --candidate")
+        roots = ([(folder, "reference") for folder in args.reference]
+                 + [(folder, "candidate") for folder in args.candidate])
+    elif not args.folder:
+        parser.error("falta la carpeta a analizar")
+    else:
+        roots = [(args.folder, None)]
+    for folder, _ in roots:
+        if not os.path.isdir(folder):
+            parser.error(f"no existe la carpeta {folder}")
+    if not 0 <= args.threshold <= 20:
+        parser.error("--threshold debe estar entre 0 y 20")
+    if args.prefetch < 0:
+        parser.error("--prefetch no puede ser negativo")
+    if args.profiler == "pyinstrument" and importlib.util.find_spec("pyinstrument") is None:
+        parser.error("--profiler pyinstrument necesita el paquete pyinstrument")
+
+    options = dict(workers=args.workers, cache_path=args.cache_path,
+                   use_cache=not args.no_cache, grouping=args.grouping,
+                   incremental=args.incremental, algorithm=args.algorithm,
+                   verify=args.verify, dihedral=args.dihedral, prefetch=args.prefetch,
+                   prefetch_bytes=args.prefetch_mb * 2 ** 20 if args.prefetch_mb else None)
+    if cross:
+        scanner = SetComparison(roots, args.threshold, args.exclude_subfolders, **options)
+    else:
+        scanner = Scanner(args.folder, args.threshold, args.exclude_subfolders, **options)
+    try:
+        with profiler(args.profiler, args.profiler_output):
+            duplicates = scanner.run()
+    except KeyboardInterrupt:
+        scanner.stop()
+        return 130
+    if duplicates is None:
+        return 130
+    if args.profile:
+        scanner.profile.dump(args.profile)
+    if args.verify:
+        print(f"Pares candidatos: {scanner.candidate_pairs}, "
+              f"confirmados: {scanner.confirmed_pairs}", file=sys.stderr)
+
+    write = write_json if args.format == "json" else write_csv
+    roles = scanner.roles if cross else None
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as out:
+            write(duplicates, out, roles)
+    else:
+        write(duplicates, sys.stdout, roles)
+    return 0
+
+if __name__ == "__main__":
+    # Necesario para el pool de procesos en ejecutables congelados
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""Operaciones masivas sobre los archivos encontrados, sin dependencias de Qt.
+
+Enviar a la papelera, mover o enlazar miles de archivos se hace por lotes
+en un pool de hilos. Los errores se acumulan en un informe en lugar de
+detener la operación, y ``stop`` la cancela entre archivo y archivo.
+"""
+import os
+import errno
+import shutil
+import filecmp
+import threading
+import concurrent.futures
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: solo enlaces duros
+    fcntl = None
+
+# ioctl de Linux que hace que un archivo comparta los bloques de otro (btrfs, XFS)
+FICLONE = 0x40049409
+
+class OperationReport:
+    """Resultado de una operación masiva."""
+
+    def __init__(self):
+        self.done = []      # rutas procesadas
+        self.errors = []    # (ruta, mensaje)
+        self.cancelled = False
+        self.bytes_reclaimed = 0
+
+    def error_summary(self, limit=10):
+        lines = [f"{path}: {message}" for path, message in self.errors[:limit]]
+        if len(self.errors) > limit:
+            lines.append(f"… y {len(self.errors) - limit} más")
+        return "\n".join(lines)
+
+def reflink(src, dst):
+    """Crea ``dst`` compartiendo los bloques de ``src`` (copia por referencia)."""
+    if fcntl is None or not hasattr(fcntl, "ioctl"):
+        raise OSError(errno.EOPNOTSUPP, os.strerror(errno.EOPNOTSUPP))
+    with open(src, "rb") as fsrc:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            fcntl.ioctl(fd, FICLONE, fsrc.fileno())
+        except OSError:
+            os.close(fd)
+            os.remove(dst)
+            raise
+        os.close(fd)
+
+class BulkOperation:
+    """Envía a la papelera (``"trash"``), mueve (``"move"``) o enlaza (``"link"``) archivos.
+
+    Los archivos se reparten en lotes de ``BATCH_SIZE`` que procesa un pool
+    de hilos: la papelera recibe cada lote en una sola llamada y los
+    movimientos son renombrados dentro del mismo sistema de archivos, con
+    copia y borrado cuando el destino está en otro. Los nombres de destino
+    se deciden antes de empezar a partir del listado de la carpeta, así no
+    hay que consultar el disco por cada colisión. El progreso (0-100) se
+    comunica llamando a ``progress``.
+
+    Enlazar sustituye cada ruta por un enlace al archivo que indica
+    ``keep`` (``{ruta: ruta conservada}``), solo si el contenido es idéntico
+    byte a byte: con ``link_mode="auto"`` se intenta una copia por
+    referencia (``FICLONE``) y si el sistema de archivos no la admite, un
+    enlace duro. Todas las rutas siguen funcionando y el informe dice
+    cuántos bytes se liberaron.
+    """
+    ACTIONS = ("trash", "move", "link")
+    LINK_MODES = ("auto", "reflink", "hardlink")
+    BATCH_SIZE = 200
+
+    def __init__(self, paths, action, destination=None, workers=None, progress=None,
+                 keep=None, link_mode="auto"):
+        if action not in self.ACTIONS:
+            raise ValueError(f"Operación desconocida: {action}")
+        if action == "move" and not destination:
+            raise ValueError("Mover requiere una carpeta de destino")
+        if action == "link" and keep is None:
+            raise ValueError("Enlazar requiere el archivo que se conserva de cada ruta")
+        if link_mode not in self.LINK_MODES:
+            raise ValueError(f"Tipo de enlace desconocido: {link_mode}")
+        self.paths = list(paths)
+        self.action = action
+        self.destination = destination
+        self.keep = keep
+        self.link_mode = link_mode
+        # Son operaciones de E/S: más hilos que núcleos, pero sin saturar el disco
+        self.workers = workers or min(8, (os.cpu_count() or 1) * 2)
+        self.on_progress = progress
+        self._isRunning = True
+
+    @property
+    def is_running(self):
+        return self._isRunning
+
+    def stop(self):
+        self._isRunning = False
+
+    def plan_moves(self):
+        """Asigna a cada archivo un nombre libre en el destino.
+
+        Sigue la convención de siempre (``nombre_1.ext``, ``nombre_2.ext``…)
+        pero contra un conjunto en memoria con lo que ya hay en la carpeta y
+        lo que ya se asignó, y recordando el último sufijo de cada nombre.
+        """
+        taken = {os.path.normcase(name) for name in os.listdir(self.destination)}
+        next_suffix = {}
+        targets = []
+        for path in self.paths:
+            name = os.path.basename(path)
+            if os.path.normcase(name) in taken:
+                base, ext = os.path.splitext(name)
+                i = next_suffix.get(os.path.normcase(name), 1)
+                while os.path.normcase(f"{base}_{i}{ext}") in taken:
+                    i += 1
+                next_suffix[os.path.normcase(name)] = i + 1
+                name = f"{base}_{i}{ext}"
+            taken.add(os.path.normcase(name))
+            targets.append((path, os.path.join(self.destination, name)))
+        return targets
+
+    def trash_batch(self, batch):
+        done = []
+        errors = []
+        if not self._isRunning:
+            return done, errors, 0
+        # Se importa al usarse: no hace falta para arrancar la interfaz
+        from send2trash import send2trash
+        paths = []
+        for path, _ in batch:
+            if os.path.lexists(path):
+                paths.append(path)
+            else:
+                errors.append((path, os.strerror(errno.ENOENT)))
+        try:
+            send2trash(paths)
+            return paths, errors, 0
+        except Exception:
+            pass
+        # Si el lote falla, repetir archivo por archivo para saber cuál fue;
+        # los que ya no existen se enviaron antes del error
+        for path in paths:
+            if not self._isRunning:
+                break
+            try:
+                if os.path.lexists(path):
+                    send2trash(path)
+                done.append(path)
+            except Exception as e:
+                errors.append((path, str(e)))
+        return done, errors, 0
+
+    def move_batch(self, batch):
+        done = []
+        errors = []
+        for path, target in batch:
+            if not self._isRunning:
+                break
+            try:
+                try:
+                    os.rename(path, target)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    # Otro sistema de archivos: copiar y borrar el original
+                    shutil.move(path, target)
+                done.append(path)
+            except OSError as e:
+                errors.append((path, e.strerror or str(e)))
+        return done, errors, 0
+
+    def link_file(self, path, keep):
+        """Sustituye ``path`` por un enlace a ``keep``; devuelve los bytes liberados."""
+        st = os.stat(path)
+        keep_st = os.stat(keep)
+        if os.path.samestat(st, keep_st):
+            return 0
+        if st.st_size != keep_st.st_size or not filecmp.cmp(path, keep, shallow=False):
+            raise ValueError("el contenido no es idéntico")
+        if st.st_dev != keep_st.st_dev:
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        # El enlace se crea aparte y se renombra encima: la ruta nunca queda
+        # a medias ni desaparece aunque falle algo
+        folder, name = os.path.split(path)
+        tmp = os.path.join(folder, f".{name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        cloned = False
+        if self.link_mode != "hardlink":
+            try:
+                reflink(keep, tmp)
+                cloned = True
+            except OSError:
+                if self.link_mode == "reflink":
+                    raise
+        try:
+            if cloned:
+                # La copia por referencia es otro archivo: conserva fechas y permisos
+                shutil.copystat(path, tmp)
+            else:
+                os.link(keep, tmp)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            raise
+        # Si el archivo tenía otros enlaces duros sus bloques siguen en uso
+        return st.st_size if st.st_nlink == 1 else 0
+
+    def link_batch(self, batch):
+        done = []
+        errors = []
+        reclaimed = 0
+        for path, keep in batch:
+            if not self._isRunning:
+                break
+            try:
+                reclaimed += self.link_file(path, keep)
+                done.append(path)
+            except (OSError, ValueError) as e:
+                errors.append((path, getattr(e, "strerror", None) or str(e)))
+        return done, errors, reclaimed
+
+    def run(self):
+        report = OperationReport()
+        if self.action == "move":
+            try:
+                items = self.plan_moves()
+            except OSError as e:
+                report.errors.append((self.destination, e.strerror or str(e)))
+                return report
+            run_batch = self.move_batch
+        elif self.action == "link":
+            items = [(path, self.keep[path]) for path in self.paths]
+            run_batch = self.link_batch
+        else:
+            items = [(path, None) for path in self.paths]
+            run_batch = self.trash_batch
+
+        total = len(items)
+        processed = 0
+        last_percent = -1
+        batches = [items[i:i + self.BATCH_SIZE] for i in range(0, total, self.BATCH_SIZE)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(run_batch, batch): len(batch) for batch in batches}
+            for future in concurrent.futures.as_completed(futures):
+                done, errors, reclaimed = future.result()
+                report.done.extend(done)
+                report.errors.extend(errors)
+                report.bytes_reclaimed += reclaimed
+                processed += futures[future]
+                percent = int(processed / total * 100)
+                if percent != last_percent:
+                    last_percent = percent
+                    if self.on_progress:
+                        self.on_progress(percent)
+        report.cancelled = not self._isRunning
+        return report